@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from visualization import Helmet, Position, Satellites
+from cli import lat_lon
+from mock_helmet import MOCK_PORT
+
+# Drives the helmet like EarthCanvas does, once per frame, with alerts taken
+# from real traces, and reports how the mock device saw the traffic.
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--satellite_directory', type=str, required=True,
+                        help='Folder with satellite files')
+    parser.add_argument('--device_location', type=lat_lon, required=True,
+                        help='Lat lon')
+    parser.add_argument('--alert_radius_km', type=float, default=2000.0,
+                        help='Great circle alert radius in km')
+    parser.add_argument('--frames', type=int, default=100000,
+                        help='Number of simulated frames')
+    parser.add_argument('--time_step', type=float, default=1.0,
+                        help='Trace seconds that pass between frames')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    device = Position(0, args.device_location[0], args.device_location[1])
+    satellites = Satellites(args.satellite_directory, 1, interpolate=True)
+    satellites.set_initial_readout(update_timestamps=False)
+    start = satellites.clock_timestamp
+    helmet = Helmet(MOCK_PORT)
+    slowest = 0.0
+    begin = time.perf_counter()
+    for frame in range(args.frames):
+        timestamp = start + frame * args.time_step
+        lat, lon, valid = satellites.positions_at(timestamp)
+        for i, sat_name in enumerate(satellites.tracks):
+            if valid[i]:
+                satellites.set_position(sat_name, Position(timestamp, float(lat[i]), float(lon[i])))
+        call_start = time.perf_counter()
+        if satellites.is_satellite_in_range(device, args.alert_radius_km):
+            helmet.activate_pump()
+        else:
+            helmet.release_pump()
+        slowest = max(slowest, time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - begin
+    print(f'{args.frames} frames for {len(satellites.tracks)} satellites in {elapsed:.2f} s')
+    print(f'Slowest helmet call {slowest*1000:.3f} ms')
+    helmet.cleanup()
+
+if __name__ == '__main__':
+    main()
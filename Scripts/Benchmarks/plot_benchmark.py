@@ -0,0 +1,76 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import matplotlib.backends.backend_agg as agg
+import pygame
+from plot_view import BlittedMapView
+
+# Compares frame rate of the old satplot_demo loop, which builds a new figure
+# every frame, with BlittedMapView. Without a screen attached run with
+# SDL_VIDEODRIVER=dummy.
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--earth_file', type=str, default='../Data/earth.jpg',
+                        help='Path to earth backdrop image')
+    parser.add_argument('--frames', type=int, default=100,
+                        help='Frames rendered in each mode')
+    parser.add_argument('--size', type=int, nargs=2, default=(800, 400),
+                        help='Plot size in pixels')
+    return parser.parse_args()
+
+
+def figure_per_frame(image, size, lat, lon):
+    # Loop body of the old demo, tostring_rgb is gone from recent matplotlib
+    # so the RGBA buffer is converted instead.
+    fig = plt.figure(figsize=[size[0] / 100, size[1] / 100], dpi=100)
+    fig.tight_layout(pad=0)
+    ax = fig.gca()
+    ax.get_xaxis().set_visible(False)
+    ax.get_yaxis().set_visible(False)
+    ax.imshow(image, extent=[-180, 180, -90, 90])
+    ax.set_xlim([-180, 180])
+    ax.set_ylim([-90, 90])
+    ax.plot([lon], [lat], 'ro', linestyle='none')
+    canvas = agg.FigureCanvasAgg(fig)
+    canvas.draw()
+    raw_data = bytes(canvas.buffer_rgba())
+    surface = pygame.image.fromstring(raw_data, canvas.get_width_height(), 'RGBA')
+    plt.close(fig)
+    return surface
+
+
+def run(render, screen, lats, lons):
+    start = time.perf_counter()
+    for lat, lon in zip(lats, lons):
+        screen.blit(render(lat, lon), (0, 0))
+        pygame.display.flip()
+    return len(lats) / (time.perf_counter() - start)
+
+
+def main():
+    args = parse_arguments()
+    pygame.init()
+    size = tuple(args.size)
+    screen = pygame.display.set_mode(size)
+    image = plt.imread(args.earth_file)
+    phase = np.linspace(0, 2 * np.pi, args.frames)
+    lats = 51.6 * np.sin(phase)
+    lons = np.degrees(phase) - 180.0
+    old_fps = run(lambda lat, lon: figure_per_frame(image, size, lat, lon), screen, lats, lons)
+    view = BlittedMapView(image, size)
+    new_fps = run(lambda lat, lon: view.update([lat], [lon]), screen, lats, lons)
+    print(f'Figure per frame {old_fps:8.1f} fps')
+    print(f'Blitted view     {new_fps:8.1f} fps')
+    print(f'Speedup {new_fps/old_fps:.1f}x')
+
+if __name__ == '__main__':
+    main()
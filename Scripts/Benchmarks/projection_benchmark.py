@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from projection import PROJECTIONS, ScreenProjection, create_projection, mercator_projection, warp_image
+
+# Compares the scalar EarthCanvas projection with the array and lookup table
+# versions and checks that they agree to within one pixel, then measures
+# throughput of every map projection.
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=8000,
+                        help='Number of projected positions')
+    parser.add_argument('--size', type=int, nargs=2, default=(1344, 1080),
+                        help='Map size in pixels')
+    parser.add_argument('--repeats', type=int, default=20,
+                        help='Number of timed repetitions')
+    parser.add_argument('--projection', type=str, nargs='*', default=sorted(PROJECTIONS),
+                        choices=sorted(PROJECTIONS), help='Projections to measure')
+    return parser.parse_args()
+
+
+def scalar_project(latitudes, longitudes, size):
+    xs, ys = [], []
+    for lat, lon in zip(latitudes, longitudes):
+        x, y = mercator_projection(lon, lat)
+        xs.append(int(x * size[0]))
+        ys.append(int(y * size[1]))
+    return np.array(xs), np.array(ys), np.ones(len(xs), dtype=bool)
+
+
+def timed(function, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def main():
+    args = parse_arguments()
+    rng = np.random.default_rng(0)
+    latitudes = rng.uniform(-90.0, 90.0, args.points)
+    longitudes = rng.uniform(-180.0, 180.0, args.points)
+    lat_list, lon_list = latitudes.tolist(), longitudes.tolist()
+    size = tuple(args.size)
+    modes = {
+        'scalar': lambda: scalar_project(lat_list, lon_list, size),
+        'array': lambda: ScreenProjection((0, 0), size, lookup=False).project(latitudes, longitudes),
+        'lookup': lambda: ScreenProjection((0, 0), size).project(latitudes, longitudes),
+        'lookup nearest': lambda: ScreenProjection((0, 0), size, interpolate=False).project(latitudes, longitudes),
+    }
+    projection = ScreenProjection((0, 0), size)
+    modes['lookup prebuilt'] = lambda: projection.project(latitudes, longitudes)
+    reference = None
+    for name, function in modes.items():
+        seconds, (xs, ys, _) = timed(function, args.repeats)
+        if reference is None:
+            reference = (xs, ys)
+            baseline = seconds
+        error = max(np.abs(xs - reference[0]).max(), np.abs(ys - reference[1]).max())
+        print(f'{name:16} {seconds*1e3:8.3f} ms  {baseline/seconds:7.1f}x  max error {error} px')
+    pixels = rng.integers(0, 255, (1024, 512, 3), dtype=np.uint8)
+    source = create_projection('equirectangular')
+    for name in args.projection:
+        map_projection = create_projection(name, (52.0, 21.0))
+        forward_seconds, (x, y) = timed(lambda: map_projection.forward(latitudes, longitudes), args.repeats)
+        inverse_seconds, _ = timed(lambda: map_projection.inverse(x, y), args.repeats)
+        warp_seconds, _ = timed(lambda: warp_image(pixels, source, map_projection, size), 1)
+        print(f'{name:16} forward {args.points/forward_seconds/1e6:7.2f} Mpts/s  '
+              f'inverse {args.points/inverse_seconds/1e6:7.2f} Mpts/s  '
+              f'backdrop warp {warp_seconds*1e3:8.1f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import cProfile
+import datetime
+import os
+import pstats
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from skyfield.api import load
+from catalog import Catalog
+from generate_positions import calculate_position, calculate_positions
+from propagation import PropagationContext
+
+# Profiles per position cost of propagation and splits it into time setup,
+# the SGP4 propagator and skyfield's conversion to the earth frame.
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--satellite_file', type=str, default='../Data/TLE/active.txt',
+                        help='Path to TLE file')
+    parser.add_argument('-v', '--satellite', type=str, default='25544',
+                        help='Name, NORAD ID or designator of profiled satellite')
+    parser.add_argument('--positions', type=int, default=2000,
+                        help='Number of propagated positions')
+    parser.add_argument('--top', type=int, default=8,
+                        help='Number of functions listed for every mode')
+    return parser.parse_args()
+
+
+def per_call_timescale(satellite, times):
+    # Propagation before the shared context: timescale loaded for every position.
+    for moment in times:
+        ts = load.timescale()
+        t = ts.utc(moment.year, moment.month, moment.day, moment.hour, moment.minute, moment.second)
+        satellite.at(t).subpoint()
+
+
+def shared_context(satellite, times):
+    context = PropagationContext()
+    for moment in times:
+        calculate_position(satellite, moment, context)
+
+
+def batched(satellite, times, context=None):
+    context = context if context is not None else PropagationContext()
+    for first in range(0, len(times), 3600):
+        calculate_positions(satellite, times[first:first + 3600], context)
+
+
+def batched_cached(satellite, times):
+    # Next satellite of a run, cached Time objects keep their nutation and
+    # precession matrices, so only the satellite specific work is left.
+    context = PropagationContext()
+    batched(satellite, times, context)
+    return lambda: batched(satellite, times, context)
+
+
+def is_setup(function):
+    file_name, _, name = function
+    return name in ('timescale', 'utc') or file_name.endswith('iers.py')
+
+
+def is_sgp4(function):
+    # Compiled SGP4 propagator of the sgp4 package.
+    return function[2] in ("<method '_sgp4' of 'sgp4.vallado_cpp.Satrec' objects>",
+                           "<method 'sgp4' of 'sgp4.vallado_cpp.Satrec' objects>")
+
+
+def time_in(stats, predicate):
+    # Cumulative time of matching functions not called from another matching one.
+    total = 0.0
+    for function, (_, _, _, cumulative, callers) in stats.stats.items():
+        if predicate(function) and not any(predicate(caller) for caller in callers):
+            total += cumulative
+    return total
+
+
+def main():
+    args = parse_arguments()
+    catalog = Catalog.load(args.satellite_file)
+    satellite = catalog.satellite(catalog.select([args.satellite])[0])
+    start = datetime.datetime(2023, 7, 1)
+    times = [start + datetime.timedelta(seconds=i) for i in range(args.positions)]
+    modes = (('timescale per call', lambda: per_call_timescale(satellite, times)),
+             ('shared context', lambda: shared_context(satellite, times)),
+             ('batched', lambda: batched(satellite, times)),
+             ('batched, cached times', batched_cached(satellite, times)))
+    for name, function in modes:
+        profile = cProfile.Profile()
+        begin = time.perf_counter()
+        profile.runcall(function)
+        elapsed = time.perf_counter() - begin
+        stats = pstats.Stats(profile)
+        setup = time_in(stats, is_setup) / stats.total_tt
+        sgp4 = time_in(stats, is_sgp4) / stats.total_tt
+        print(f'{name}: {elapsed/args.positions*1e6:.1f} us per position, time setup {setup:.0%}, '
+              f'sgp4 {sgp4:.0%}, frame conversion and subpoint {1 - setup - sgp4:.0%}')
+        stats.sort_stats('tottime').print_stats(args.top)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pygame
+from visualization import (EarthCanvas, Helmet, HeadCanvas, ManWhoLaughsDisplay,
+                           Position, Satellites, TextField, TextField2, TextRenderCache)
+
+# Compares CPU time per frame of full screen flips and dirty rectangle updates.
+# The full flip run is the path from before dirty rectangles, text is
+# rendered and drawn again every frame. Without a screen attached run with
+# SDL_VIDEODRIVER=dummy.
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-g', '--gif_file', type=str, default='../Data/small.gif',
+                        help='Path to GIF file')
+    parser.add_argument('-e', '--earth_file', type=str, default='../Data/earth.jpg',
+                        help='Path to earth backdrop image')
+    parser.add_argument('-s', '--satellite_directory', type=str, required=True,
+                        help='Folder with satellite files')
+    parser.add_argument('--frames', type=int, default=2000,
+                        help='Frames rendered in each mode')
+    parser.add_argument('--interpolate', action='store_true',
+                        help='Interpolate satellite positions every frame')
+    return parser.parse_args()
+
+
+def run(args, full_flip):
+    satellites = Satellites(args.satellite_directory, 1, args.interpolate)
+    satellites.set_initial_readout(update_timestamps=False)
+    device_location = Position(0, 52.0, 21.0)
+    helmet = Helmet(None)
+    earth = EarthCanvas(args.earth_file, satellites, (0.3, 0.0), (0.7, 1.0),
+                        device_location, helmet=helmet, alert_distance=10.0)
+    head = HeadCanvas(args.gif_file, 30, (0.02, 0.6), (0.2, 0.23))
+    # Empty cache makes every text render a miss, as with no cache at all.
+    text_cache = TextRenderCache(0 if full_flip else 256)
+    text_field = TextField((0.1, 0.0), satellites=satellites, text_cache=text_cache)
+    text_field2 = TextField2((0.15, 0.91), (52.0, 21.0), text_cache=text_cache)
+    display = ManWhoLaughsDisplay(head, earth, helmet, text_field, text_field2,
+                                  full_flip=full_flip)
+    start = time.process_time()
+    for _ in range(args.frames):
+        display.update()
+    elapsed = time.process_time() - start
+    display.cleanup()
+    return elapsed / args.frames
+
+
+def main():
+    args = parse_arguments()
+    pygame.init()
+    results = {}
+    for full_flip in (True, False):
+        results[full_flip] = run(args, full_flip)
+    print(f'Full flip       {results[True]*1000:.3f} ms CPU per frame')
+    print(f'Dirty rectangles {results[False]*1000:.3f} ms CPU per frame')
+    print(f'Speedup {results[True]/results[False]:.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from generate_positions import BATCH_SIZE, DiscreteTimeDomain
+from trace_format import TraceWriter
+
+# Measures rows per second of the trace output stage alone, positions are
+# random so propagation time is not included.
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=86401,
+                        help='Number of written positions')
+    parser.add_argument('-b', '--batch_size', type=int, default=BATCH_SIZE,
+                        help='Rows written at once')
+    return parser.parse_args()
+
+
+def row_writes(path, time_domain, latitudes, longitudes, batch_size):
+    # Output stage before chunked writing: mktime and write for every row.
+    with open(path, 'w') as sat_file:
+        time_domain.reset()
+        for t, latitute, longitude in zip(time_domain, latitudes, longitudes):
+            timestamp = int(time.mktime(t.timetuple()))
+            sat_file.write(f'{timestamp};{latitute};{longitude}\n')
+
+
+def joined_chunks(path, time_domain, latitudes, longitudes, batch_size):
+    # Rows joined per chunk but timestamps still converted from datetimes.
+    with open(path, 'w') as sat_file:
+        first = 0
+        for times in time_domain.chunks(batch_size):
+            lines = []
+            for t, latitute, longitude in zip(times, latitudes[first:], longitudes[first:]):
+                timestamp = int(time.mktime(t.timetuple()))
+                lines.append(f'{timestamp};{latitute};{longitude}\n')
+            sat_file.write(''.join(lines))
+            first += len(times)
+
+
+def trace_writer(output_format, compression=None):
+    def write(path, time_domain, latitudes, longitudes, batch_size):
+        with TraceWriter(path, output_format, compression=compression) as writer:
+            for first in range(0, len(latitudes), batch_size):
+                indexes = np.arange(first, min(first + batch_size, len(latitudes)))
+                writer.write(time_domain.timestamps(indexes), latitudes[indexes], longitudes[indexes])
+    return write
+
+
+def main():
+    args = parse_arguments()
+    rng = np.random.default_rng(0)
+    latitudes = rng.uniform(-90.0, 90.0, args.rows)
+    longitudes = rng.uniform(-180.0, 180.0, args.rows)
+    start = datetime.datetime(2023, 7, 1)
+    time_domain = DiscreteTimeDomain(start, start + datetime.timedelta(seconds=args.rows - 1))
+    modes = {
+        'row writes': ('.txt', row_writes),
+        'joined chunks': ('.txt', joined_chunks),
+        'writer text': ('.txt', trace_writer('text')),
+        'writer text gzip': ('.txt.gz', trace_writer('text', 'gzip')),
+        'writer binary': ('.trace', trace_writer('binary')),
+        'writer binary gzip': ('.trace.gz', trace_writer('binary', 'gzip')),
+    }
+    try:
+        import zstandard
+        modes['writer text zstd'] = ('.txt.zst', trace_writer('text', 'zstd'))
+        modes['writer binary zstd'] = ('.trace.zst', trace_writer('binary', 'zstd'))
+    except ImportError:
+        print('zstandard is not installed, skipping zstd')
+    baseline = None
+    with tempfile.TemporaryDirectory() as folder:
+        for name, (extension, write) in modes.items():
+            path = os.path.join(folder, name.replace(' ', '_') + extension)
+            begin = time.perf_counter()
+            write(path, time_domain, latitudes, longitudes, args.batch_size)
+            rate = args.rows / (time.perf_counter() - begin)
+            baseline = baseline or rate
+            print(f'{name:20} {rate/1e3:9.1f} k rows/s  {rate/baseline:5.1f}x  '
+                  f'{os.path.getsize(path)/args.rows:5.1f} bytes/row')
+
+if __name__ == '__main__':
+    main()
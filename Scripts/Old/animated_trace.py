@@ -1,19 +1,23 @@
+import os
+import sys
 import pygame
 import datetime
 from skyfield.api import Topos, load, EarthSatellite
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from propagation import context, timescale
+
 # Function to parse TLE entry and return satellite object
 def parse_tle(tle_data):
     lines = tle_data.strip().split('\n')
     #print(lines)
-    ts = load.timescale()
+    ts = timescale()
     satellite = EarthSatellite(lines[1], lines[2], 'ISS (ZARYA)', ts)
     return satellite
 
 # Function to calculate satellite position for a given time
 def calculate_position(satellite, time):
-    ts = load.timescale()
-    t = ts.utc(time.year, time.month, time.day, time.hour, time.minute, time.second)
+    t = context().time(time)
     geocentric = satellite.at(t)
     subpoint = geocentric.subpoint()
     #print(subpoint)
@@ -1,6 +1,6 @@
+import os
 import sys
 import pygame
-import pylab
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
@@ -9,8 +9,9 @@ from beyond.io.tle import Tle
 from beyond.dates import Date, timedelta
 
 matplotlib.use("Agg")
-matplotlib.rcParams['savefig.pad_inches'] = 0
-import matplotlib.backends.backend_agg as agg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_view import BlittedMapView
 
 ISS_TLE = Tle("""ISS (ZARYA)
 1 25544U 98067A   19004.59354167  .00000715  00000-0  18267-4 0  9995
@@ -83,6 +84,9 @@ orb, coords = tle_to_coordinate_list(ISS_TLE)
 
 running = True
 im = plt.imread('Data/earth.jpg')
+# Figure and backdrop are drawn once, frames only move the marker.
+view = BlittedMapView(im, (width, height))
+plt_surface = view.update([], [])
 
 # Animation loop
 while running:
@@ -94,32 +98,9 @@ while running:
     # Clear the screen
     screen.fill((255, 255, 255))
 
-
-    
     try:
-        lons, lats = next(coords)
-        fig = pylab.figure(figsize=[8, 4], # Inches
-                   dpi=100,
-                   )
-        fig.tight_layout(pad=0)
-        ax = fig.gca()
-        ax.get_xaxis().set_visible(False)
-        ax.get_yaxis().set_visible(False)
-        #ax.set_axis_off()
-        #ax.margins(x=0, y=0)
-        plt.autoscale(tight=True)
-        ax.imshow(im, extent=[-180, 180, -90, 90])
-        ax.set_xlim([-180, 180])
-        ax.set_ylim([-90, 90])
-        ax.plot([lons], [lats], 'ro', linestyle='none')
-
-        canvas = agg.FigureCanvasAgg(fig)
-        canvas.draw()
-        renderer = canvas.get_renderer()
-        raw_data = renderer.tostring_rgb()
-        size = canvas.get_width_height()
-        plt_surface = pygame.image.fromstring(raw_data, size, "RGB")
-        plt.close(fig)
+        lats, lons = next(coords)
+        plt_surface = view.update([lats], [lons])
     except StopIteration:
         pass # In this demo just stop updating and ignore event
     # Display the plot on the screen
@@ -1,24 +1,8 @@
-import math
+import os
+import sys
 
-def mercator_projection(longitude, latitude):
-    # Define the Mercator projection bounds
-    max_longitude = 180.0
-    min_longitude = -180.0
-    max_latitude = 85.051129
-    min_latitude = -85.051129
-
-    # Clamp the longitude and latitude within the bounds
-    longitude = max(min(longitude, max_longitude), min_longitude)
-    latitude = max(min(latitude, max_latitude), min_latitude)
-
-    # Convert latitude and longitude to radians
-    lat_rad = math.radians(latitude)
-
-    # Perform the Mercator projection
-    x = (longitude + 180.0) / 360.0
-    y = (1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0
-
-    return x, y
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from projection import mercator_projection
 
 # Test the function
 longitude = 0.0
@@ -0,0 +1,194 @@
+import argparse
+import fnmatch
+import hashlib
+import os
+import pickle
+import time
+from urllib.parse import urlparse
+from skyfield.api import EarthSatellite, load
+from propagation import timescale
+
+# Parsed TLE catalogs are pickled as plain lines and lookup tables, sgp4
+# models are only built for selected satellites since they can not be pickled.
+CACHE_VERSION = 2
+GLOB_CHARACTERS = '*?['
+
+
+def local_path(tle_file):
+    # Urls are downloaded once to the skyfield data folder like load.tle_file does.
+    if '://' not in tle_file:
+        return tle_file
+    filename = os.path.basename(urlparse(tle_file).path)
+    if not load.exists(filename):
+        load.download(tle_file, filename=filename)
+    return load.path_to(filename)
+
+
+def norad_key(number):
+    number = str(number).strip().upper()
+    return str(int(number)) if number.isdigit() else number
+
+
+def separated_words(text):
+    return text.upper().replace('-', ' ').replace('_', ' ').split()
+
+
+def designator_key(designator):
+    # Accepts TLE form 98067A and COSPAR form 1998-067A with any separators,
+    # None when designator has neither form.
+    key = ''.join(separated_words(designator))
+    digits = len(key) - len(key.lstrip('0123456789'))
+    if digits == 7:
+        key = key[2:]
+        digits = 5
+    if digits != 5 or not 1 <= len(key) - digits <= 3 or not key[digits:].isalpha():
+        return None
+    return key
+
+
+def name_key(name):
+    # Sources spell names with different separators, NOAA-15 is NOAA 15.
+    return ' '.join(separated_words(name))
+
+
+def parse_tle_lines(lines):
+    names, first_lines, second_lines = [], [], []
+    previous = None
+    first = None
+    for line in lines:
+        line = line.rstrip()
+        if line.startswith('1 ') and len(line) >= 64:
+            first = line
+        elif line.startswith('2 ') and first is not None:
+            name = previous.strip() if previous is not None else first[2:7].strip()
+            if name.startswith('0 '):
+                name = name[2:]
+            names.append(name)
+            first_lines.append(first)
+            second_lines.append(line)
+            first = None
+            previous = None
+        else:
+            previous = line
+            first = None
+    return names, first_lines, second_lines
+
+
+class Catalog:
+
+    def __init__(self, names, first_lines, second_lines, source=None):
+        self.names = names
+        self.first_lines = first_lines
+        self.second_lines = second_lines
+        self.source = source
+        self.by_name = {}
+        self.by_name_key = {}
+        self.by_norad = {}
+        self.by_designator = {}
+        for index, (name, line) in enumerate(zip(names, first_lines)):
+            # First entry wins, like a name dict built from load.tle_file.
+            self.by_name.setdefault(name, index)
+            self.by_name_key.setdefault(name_key(name), index)
+            self.by_norad.setdefault(norad_key(line[2:7]), index)
+            designator = designator_key(line[9:17])
+            if designator is not None:
+                self.by_designator.setdefault(designator, index)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def parse(cls, tle_file):
+        path = local_path(tle_file)
+        with open(path) as source_file:
+            names, first_lines, second_lines = parse_tle_lines(source_file)
+        return cls(names, first_lines, second_lines, path)
+
+    @classmethod
+    def load(cls, tle_file, cache_folder=None):
+        # Cache entries are valid as long as the TLE file has the same mtime and size.
+        path = local_path(tle_file)
+        if cache_folder is None:
+            return cls.parse(path)
+        status = os.stat(path)
+        stamp = (CACHE_VERSION, status.st_mtime_ns, status.st_size)
+        digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+        cache_path = os.path.join(cache_folder, f'{os.path.basename(path)}_{digest}.catalog')
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as cache_file:
+                cached_stamp, catalog = pickle.load(cache_file)
+            if cached_stamp == stamp:
+                return catalog
+        catalog = cls.parse(path)
+        os.makedirs(cache_folder, exist_ok=True)
+        temporary_path = cache_path + '.tmp'
+        with open(temporary_path, 'wb') as cache_file:
+            pickle.dump((stamp, catalog), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, cache_path)
+        return catalog
+
+    def find(self, pattern):
+        # Pattern is a name, NORAD ID, international designator or name glob.
+        # Returns indexes in catalog order, empty list when nothing matches.
+        pattern = pattern.strip()
+        if pattern in self.by_name:
+            return [self.by_name[pattern]]
+        if pattern.isdigit() and norad_key(pattern) in self.by_norad:
+            return [self.by_norad[norad_key(pattern)]]
+        designator = designator_key(pattern)
+        if designator is not None and designator in self.by_designator:
+            return [self.by_designator[designator]]
+        if name_key(pattern) in self.by_name_key:
+            return [self.by_name_key[name_key(pattern)]]
+        if any(character in pattern for character in GLOB_CHARACTERS):
+            pattern = pattern.upper()
+            return [i for i, name in enumerate(self.names)
+                    if fnmatch.fnmatchcase(name.upper(), pattern)]
+        return []
+
+    def select(self, patterns):
+        selected = []
+        seen = set()
+        for pattern in patterns:
+            indexes = self.find(pattern)
+            if not indexes:
+                raise KeyError(f'No satellite in catalog matches {pattern!r}')
+            for index in indexes:
+                if index not in seen:
+                    seen.add(index)
+                    selected.append(index)
+        return selected
+
+    def satellite(self, index, ts=None):
+        return EarthSatellite(self.first_lines[index], self.second_lines[index],
+                              self.names[index], ts if ts is not None else timescale())
+
+    def satellites(self, indexes=None, ts=None):
+        ts = ts if ts is not None else timescale()
+        if indexes is None:
+            indexes = range(len(self))
+        return [self.satellite(index, ts) for index in indexes]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('tle_file', type=str,
+                        help='Path to TLE file, may be url')
+    parser.add_argument('patterns', type=str, nargs='*',
+                        help='Names, NORAD IDs, designators or name globs to look up')
+    parser.add_argument('--cache', type=str, default='./local/catalog',
+                        help='Folder for parsed catalogs')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    start = time.perf_counter()
+    catalog = Catalog.load(args.tle_file, args.cache)
+    print(f'Loaded {len(catalog)} satellites in {(time.perf_counter() - start)*1000:.1f} ms')
+    for index in catalog.select(args.patterns):
+        print(f'{catalog.first_lines[index][2:7]} {catalog.first_lines[index][9:17].strip():8} '
+              f'{catalog.names[index]}')
+
+if __name__ == '__main__':
+    main()
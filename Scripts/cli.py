@@ -0,0 +1,17 @@
+import argparse
+
+# Argument types shared by the scripts.
+
+
+def float_pair(txt):
+    # Pair like 52.2x21.0, n stands for minus sign.
+    txt = txt.replace('n','-')
+    val1, val2 = txt.split('x')
+    return (float(val1), float(val2))
+
+
+def lat_lon(txt):
+    lat, lon = float_pair(txt)
+    if not -90.0 <= lat <= 90.0 or not -180.0 <= lon <= 180.0:
+        raise argparse.ArgumentTypeError(f'{txt} is not a latitude x longitude in degrees')
+    return (lat, lon)
@@ -1,10 +1,24 @@
 import time
 import argparse
+import calendar
 import datetime
+import glob
 import os
-from skyfield.api import Topos, load
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from sgp4.api import Satrec, SatrecArray
+import trace_format
+import propagation
+from observer import Observer, find_events, write_events
+from cli import lat_lon
+from proximity import haversine
+from catalog import Catalog
+from tle_store import MAX_AGE_HOURS, TleStore
 
 TIME_FORMAT = '%Y-%m-%d-%H:%M:%S'
+BATCH_SIZE = 3600
+MAX_STEP = 300
 
 class DiscreteTimeDomain:
 
@@ -30,32 +44,243 @@ class DiscreteTimeDomain:
         self.current += self.step
         return return_value
 
-def load_satellites(file_path):
-    satellites = load.tle_file(file_path)
-    print('Loaded', len(satellites), 'satellites')
-    return satellites
+    def chunks(self, size):
+        self.reset()
+        chunk = []
+        for t in self:
+            chunk.append(t)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
 
+    def timestamps(self, indexes):
+        # Unix timestamps of samples with given indexes, computed from the start
+        # timestamp instead of converting every datetime. Like time.mktime the
+        # start is taken as local time.
+        start = int(time.mktime(self.start.timetuple()))
+        return start + np.rint(np.asarray(indexes) * self.step.total_seconds()).astype(np.int64)
 
-def calculate_position(satellite, time):
-    ts = load.timescale()
-    t = ts.utc(time.year, time.month, time.day, time.hour, time.minute, time.second)
-    geocentric = satellite.at(t)
-    subpoint = geocentric.subpoint()
-    latitude = subpoint.latitude.degrees
-    longitude = subpoint.longitude.degrees
-    return latitude, longitude
+    def split(self, parts):
+        samples = int((self.end - self.start) / self.step) + 1
+        domains = []
+        first = 0
+        for part in range(parts):
+            last = samples * (part + 1) // parts
+            if last > first:
+                domains.append(DiscreteTimeDomain(self.start + first * self.step,
+                                                  self.start + (last - 1) * self.step,
+                                                  self.step.total_seconds()))
+            first = last
+        return domains
 
+def load_satellites(file_path, cache_folder=None):
+    catalog = Catalog.load(file_path, cache_folder)
+    print('Loaded', len(catalog), 'satellites')
+    return catalog
 
-def create_trace_file(satellite, time_domain, output_folder):
+
+def calculate_position(satellite, time, context=None):
+    context = context if context is not None else propagation.context()
+    return context.subpoint(satellite, time)
+
+
+def calculate_positions(satellite, times, context=None, cache=True):
+    # Calendar fields are passed as arrays so times are converted exactly as in
+    # calculate_position, only the ITRS rotation may differ in the last digit.
+    context = context if context is not None else propagation.context()
+    latitudes, longitudes = context.subpoints(satellite, times, cache)
+    return latitudes.tolist(), longitudes.tolist()
+
+
+def interpolation_error(times, lats, lons, starts, ends, test_times, test_lats, test_lons):
+    # Distance in km between propagated test points and the position the
+    # display interpolates from the interval ends, see Satellites.positions_at.
+    fraction = (test_times - times[starts]) / (times[ends] - times[starts])
+    lat = lats[starts] + (lats[ends] - lats[starts]) * fraction
+    lon_delta = (lons[ends] - lons[starts] + 180.0) % 360.0 - 180.0
+    lon = (lons[starts] + lon_delta * fraction + 180.0) % 360.0 - 180.0
+    return haversine(lat, lon, test_lats, test_lons)
+
+
+def adaptive_samples(satellite, time_domain, max_error_km, max_step=MAX_STEP, context=None):
+    # Starts from a grid of max_step seconds and splits every interval whose
+    # quarter points are further than max_error_km from the interpolated track.
+    # Tracks bend in lat/lon near the poles, so samples get denser there, and
+    # a split is forced while an interval spans more than 90 degrees of
+    # longitude so the shorter arc across the antimeridian is the right one.
+    # Only quarter points are checked, so between them the error may exceed
+    # max_error_km by a few percent. Samples stay on the time_domain grid and
+    # all new points of a round are propagated in one batch.
+    context = context if context is not None else propagation.context()
+    step = time_domain.step
+    last = int((time_domain.end - time_domain.start) / step)
+    stride = max(1, int(max_step / step.total_seconds()))
+    indexes = np.unique(np.append(np.arange(0, last + 1, stride), last))
+    lats, lons = calculate_positions(satellite, [time_domain.start + int(i) * step for i in indexes], context)
+    samples = dict(zip(indexes.tolist(), zip(lats, lons)))
+    while True:
+        indexes = np.array(sorted(samples))
+        lats = np.array([samples[i][0] for i in indexes])
+        lons = np.array([samples[i][1] for i in indexes])
+        gaps = np.flatnonzero(np.diff(indexes) > 1)
+        if len(gaps) == 0:
+            break
+        starts, ends = gaps, gaps + 1
+        tests = np.stack([indexes[starts] + (indexes[ends] - indexes[starts]) * k // 4
+                          for k in (1, 2, 3)])
+        flat_tests = np.unique(tests)
+        test_lats, test_lons = calculate_positions(
+            satellite, [time_domain.start + int(i) * step for i in flat_tests], context, cache=False)
+        tested = dict(zip(flat_tests.tolist(), zip(test_lats, test_lons)))
+        test_lats = np.array([[tested[i][0] for i in row] for row in tests.tolist()])
+        test_lons = np.array([[tested[i][1] for i in row] for row in tests.tolist()])
+        error = interpolation_error(indexes, lats, lons, starts, ends, tests, test_lats, test_lons)
+        wide = np.abs((lons[ends] - lons[starts] + 180.0) % 360.0 - 180.0) > 90.0
+        split = (error.max(axis=0) > max_error_km) | wide
+        if not split.any():
+            break
+        for column in np.flatnonzero(split):
+            for i in tests[:, column].tolist():
+                samples[i] = tested[i]
+    return time_domain.timestamps(indexes), lats, lons
+
+
+def trace_file_path(satellite_name, output_folder, output_format='text', compression=None):
+    if output_format == 'binary':
+        extension = trace_format.BINARY_EXTENSION
+    else:
+        extension = trace_format.TEXT_EXTENSION
+    if compression is not None:
+        extension += trace_format.COMPRESSION_EXTENSIONS[compression]
+    return os.path.join(output_folder, f'{satellite_name.replace(" ","_")}{extension}')
+
+
+def write_trace(satellite, time_domain, file_path, batch_size=BATCH_SIZE,
+                output_format='text', precision=64, max_error_km=None, max_step=MAX_STEP,
+                compression=None):
+    # Timestamps come from the domain start and step, positions are written
+    # in chunks of batch_size samples.
+    with trace_format.TraceWriter(file_path, output_format, precision, compression,
+                                  adaptive=max_error_km is not None) as writer:
+        if max_error_km is not None:
+            writer.write(*adaptive_samples(satellite, time_domain, max_error_km, max_step))
+            return
+        context = propagation.context()
+        first = 0
+        for times in time_domain.chunks(BATCH_SIZE if batch_size <= 1 else batch_size):
+            if batch_size <= 1:
+                positions = [calculate_position(satellite, t, context) for t in times]
+                latitudes = [position[0] for position in positions]
+                longitudes = [position[1] for position in positions]
+            else:
+                latitudes, longitudes = calculate_positions(satellite, times, context)
+            indexes = np.arange(first, first + len(times))
+            writer.write(time_domain.timestamps(indexes), latitudes, longitudes)
+            first += len(times)
+
+
+def create_trace_file(satellite, time_domain, output_folder, batch_size=BATCH_SIZE,
+                      output_format='text', precision=64, max_error_km=None, max_step=MAX_STEP,
+                      compression=None):
     print(f'Processing {satellite.name}')
-    file_path = os.path.join(output_folder, f'{satellite.name.replace(" ","_")}.txt')
-    with open(file_path, 'w') as sat_file:
-        time_domain.reset()
-        for t in time_domain:
-            latitute , longitude = calculate_position(satellite, t)
-            timestamp = time.mktime(t.timetuple())
-            timestamp = int(timestamp)
-            sat_file.write(f'{timestamp};{latitute};{longitude}\n')
+    file_path = trace_file_path(satellite.name, output_folder, output_format, compression)
+    write_trace(satellite, time_domain, file_path, batch_size, output_format, precision,
+                max_error_km, max_step, compression)
+
+
+worker_satellites = None
+
+def init_worker(satellite_file, cache_folder, workers=1):
+    global worker_satellites
+    # Workers load the catalog on their own from the file resolved by the main
+    # process, the parse cache is already filled by then. Every worker keeps
+    # its own times, so they share the memory one process would use.
+    worker_satellites = Catalog.load(satellite_file, cache_folder)
+    propagation.context(propagation.CACHE_BYTES // workers)
+
+
+def trace_part_job(satellite_index, time_domain, file_path, batch_size, output_format, precision,
+                   max_error_km=None, max_step=MAX_STEP, compression=None):
+    satellite = worker_satellites.satellite(satellite_index)
+    write_trace(satellite, time_domain, file_path, batch_size, output_format, precision,
+                max_error_km, max_step, compression)
+    return satellite.name
+
+
+def create_trace_files_parallel(satellite_file, catalog, satellite_indexes, time_domain,
+                                output_folder, workers, batch_size=BATCH_SIZE,
+                                output_format='text', precision=64, cache_folder=None,
+                                max_error_km=None, max_step=MAX_STEP, compression=None):
+    # Satellites are split into time ranges when there is fewer of them than
+    # workers, parts are joined in order so output does not depend on timing.
+    # Parts are not compressed, the joined trace is.
+    satellite_names = [catalog.names[index] for index in satellite_indexes]
+    parts = max(1, workers // len(satellite_names))
+    domains = time_domain.split(parts)
+    part_paths = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(satellite_file, cache_folder, workers)) as executor:
+        futures = {}
+        for index, name in zip(satellite_indexes, satellite_names):
+            file_path = trace_file_path(name, output_folder, output_format, compression)
+            if len(domains) == 1:
+                part_paths[name] = [file_path]
+                part_compression = compression
+            else:
+                part_paths[name] = [f'{file_path}.part{i}' for i in range(len(domains))]
+                part_compression = None
+            for domain, part_path in zip(domains, part_paths[name]):
+                future = executor.submit(trace_part_job, index, domain, part_path, batch_size,
+                                         output_format, precision, max_error_km, max_step,
+                                         part_compression)
+                futures[future] = name
+        failed = {}
+        for done, future in enumerate(as_completed(futures), start=1):
+            name = futures[future]
+            try:
+                future.result()
+                print(f'[{done}/{len(futures)}] Finished part of {name}')
+            except Exception as e:
+                failed[name] = e
+                print(f'[{done}/{len(futures)}] Failed part of {name} -> {e!r}')
+    for name in satellite_names:
+        file_path = trace_file_path(name, output_folder, output_format, compression)
+        if name in failed:
+            # Traces only appear under file_path once written whole, so a
+            # trace there is the one of a previous run and is kept.
+            leftovers = [path + '.tmp' for path in part_paths[name]]
+            leftovers += [path for path in part_paths[name] if path != file_path]
+            for leftover in leftovers:
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        elif len(domains) > 1:
+            with trace_format.TraceWriter(file_path, output_format, precision, compression,
+                                          adaptive=max_error_km is not None) as writer:
+                for part_path in part_paths[name]:
+                    writer.append_trace(part_path)
+            for part_path in part_paths[name]:
+                os.remove(part_path)
+    return failed
+
+def write_visibility_events(catalog, satellite_indexes, time_domain, observer, min_elevation,
+                            file_path):
+    # Satellites are propagated at the UTC moments of the domain, events are
+    # then labeled like trace samples so both share one clock.
+    satrecs = SatrecArray([Satrec.twoline2rv(catalog.first_lines[index], catalog.second_lines[index])
+                           for index in satellite_indexes])
+    step = time_domain.step.total_seconds()
+    count = int((time_domain.end - time_domain.start) / time_domain.step) + 1
+    start = calendar.timegm(time_domain.start.timetuple())
+    events = find_events(satrecs, observer, start, count, step, min_elevation)
+    events['timestamp'] += time_domain.timestamps([0])[0] - start
+    names = [catalog.names[index] for index in satellite_indexes]
+    folder = os.path.dirname(file_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    write_events(file_path, names, events, observer, min_elevation)
+    print(f'Found {len(events)} visibility events of {len(names)} satellites')
 
 def datetime_str(text):
     return datetime.datetime.strptime(text, TIME_FORMAT)
@@ -74,18 +299,91 @@ def parse_arguments():
     parser.add_argument('-t', '--timestep', type=int, default=1,
                         help='Time in seconds between two positions.')
     parser.add_argument('-v', '--satellites', type=satellite_list, required=True,
-                        help='Names of satellites that will be processed, separated by comma')
+                        help='Satellites that will be processed, separated by comma. Each entry '
+                             'is a name, NORAD ID, international designator or name glob.')
     parser.add_argument('-o', '--output_folder', type=str, default='./local',
                         help='Folder to which output will be saved')
-    return parser.parse_args()
+    parser.add_argument('-b', '--batch_size', type=int, default=BATCH_SIZE,
+                        help='Number of positions propagated at once. Coordinates of batches may '
+                             'differ from row by row propagation in the last digit (about 1e-14 deg), '
+                             '1 propagates row by row and writes the same bytes as older versions.')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of processes used to generate traces.')
+    parser.add_argument('--format', type=str, default='text', choices=('text', 'binary'),
+                        help='Format of trace files.')
+    parser.add_argument('--precision', type=int, default=64, choices=(32, 64),
+                        help='Bits used to store latitude and longitude in binary format.')
+    parser.add_argument('--compression', type=str, default=None,
+                        choices=sorted(trace_format.COMPRESSION_EXTENSIONS),
+                        help='Compress trace files, zstd needs the zstandard package.')
+    parser.add_argument('--max_error_km', type=float, default=None,
+                        help='Keep only positions needed to interpolate the track within this error, '
+                             'timestep becomes the finest step used. Needs binary format, the trace '
+                             'is marked adaptive and always played back interpolated.')
+    parser.add_argument('--max_step', type=int, default=MAX_STEP,
+                        help='Longest time in seconds between positions kept with --max_error_km.')
+    parser.add_argument('--catalog_cache', type=str, default='./local/catalog',
+                        help='Folder for parsed TLE catalogs, empty string disables caching.')
+    parser.add_argument('--tle_store', type=str, default='./local/tle',
+                        help='Folder with local copies of TLE urls.')
+    parser.add_argument('--max_tle_age', type=float, default=MAX_AGE_HOURS,
+                        help='Hours after which a stored TLE url is fetched again.')
+    parser.add_argument('--offline', action='store_true',
+                        help='Read TLE urls from the store only, never from network.')
+    parser.add_argument('--seed_store', type=str, nargs='*', default=[],
+                        help='Local TLE files copied into the store first, e.g. "../Data/TLE/*.txt".')
+    parser.add_argument('--device_location', type=lat_lon, default=None,
+                        help='Lat lon of observer as LATxLON, n marks negative values. '
+                             'Rise, culmination and set events are written when given.')
+    parser.add_argument('--device_height', type=float, default=0.0,
+                        help='Height of observer above WGS84 ellipsoid in km.')
+    parser.add_argument('--min_elevation', type=float, default=0.0,
+                        help='Elevation in degrees above which a satellite counts as visible.')
+    parser.add_argument('--events_file', type=str, default=None,
+                        help='Path of visibility events file, defaults to events.npz in output folder.')
+    args = parser.parse_args()
+    if args.max_error_km is not None and args.format != 'binary':
+        parser.error('--max_error_km needs --format binary, only binary traces can be marked adaptive')
+    return args
 
 def main():
     args = parse_arguments()
-    satellites = load_satellites(args.satellite_file)
-    satellites = {sat.name: sat for sat in satellites}
+    cache_folder = args.catalog_cache or None
+    store = TleStore(args.tle_store, args.max_tle_age, offline=args.offline)
+    store.seed([path for pattern in args.seed_store for path in sorted(glob.glob(pattern))])
+    try:
+        satellite_file = store.resolve(args.satellite_file)
+    except Exception as e:
+        print(f'Could not get {args.satellite_file} -> {e}')
+        sys.exit(1)
+    catalog = load_satellites(satellite_file, cache_folder)
+    try:
+        indexes = catalog.select(args.satellites)
+    except KeyError as e:
+        print(e.args[0])
+        sys.exit(1)
     time_domain = DiscreteTimeDomain(args.start_datetime, args.end_datetime, args.timestep)
-    for satellite in args.satellites:
-        create_trace_file(satellites[satellite], time_domain, args.output_folder)
+    os.makedirs(args.output_folder, exist_ok=True)
+    if args.device_location is not None:
+        observer = Observer(args.device_location[0], args.device_location[1], args.device_height)
+        events_file = args.events_file or os.path.join(args.output_folder, 'events.npz')
+        write_visibility_events(catalog, indexes, time_domain, observer, args.min_elevation,
+                                events_file)
+    if args.workers > 1:
+        failed = create_trace_files_parallel(satellite_file, catalog, indexes, time_domain,
+                                             args.output_folder, args.workers, args.batch_size,
+                                             args.format, args.precision, cache_folder,
+                                             args.max_error_km, args.max_step, args.compression)
+        print(f'Generated {len(indexes) - len(failed)} of {len(indexes)} traces')
+        if failed:
+            print(f'Failed satellites: {", ".join(sorted(failed))}')
+            sys.exit(1)
+        return
+    ts = propagation.timescale()
+    for index in indexes:
+        create_trace_file(catalog.satellite(index, ts), time_domain, args.output_folder,
+                          args.batch_size, args.format, args.precision,
+                          args.max_error_km, args.max_step, args.compression)
 
 if __name__ == '__main__':
     main()
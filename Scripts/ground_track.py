@@ -0,0 +1,100 @@
+import math
+import numpy as np
+
+# Ground tracks are sampled this many times per orbit, enough for the track
+# to look smooth at full screen size.
+SAMPLES_PER_PERIOD = 180
+DEFAULT_PERIOD = 5400.0
+
+
+def split_antimeridian(lats, lons):
+    # Splits a track into segments that do not cross the antimeridian. Every
+    # jump of more than 180 degrees between samples is a crossing, both
+    # segments get a point on the map edge at the interpolated latitude so
+    # the track reaches the border instead of stopping short of it.
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if len(lats) == 0:
+        return []
+    before = np.flatnonzero(np.abs(np.diff(lons)) > 180.0)
+    if len(before) == 0:
+        return [(lats, lons)]
+    after = before + 1
+    edge = np.where(lons[before] > 0, 180.0, -180.0)
+    unwrapped = lons[after] + 2.0 * edge
+    fraction = (edge - lons[before]) / (unwrapped - lons[before])
+    crossing = lats[before] + (lats[after] - lats[before]) * fraction
+    where = np.repeat(after, 2)
+    lats = np.insert(lats, where, np.repeat(crossing, 2))
+    lons = np.insert(lons, where, np.column_stack((edge, -edge)).ravel())
+    # First inserted point of k-th crossing ends up at after[k] + 2k.
+    cuts = after + 2 * np.arange(len(after)) + 1
+    return list(zip(np.split(lats, cuts), np.split(lons, cuts)))
+
+
+def estimate_period(timestamps, lats):
+    # Median time between ascending equator crossings, None for short traces.
+    lats = np.asarray(lats, dtype=np.float64)
+    ascending = np.flatnonzero((lats[:-1] < 0) & (lats[1:] >= 0))
+    if len(ascending) < 2:
+        return None
+    return float(np.median(np.diff(np.asarray(timestamps, dtype=np.float64)[ascending])))
+
+
+class GroundTracks:
+    # Past and future ground tracks of satellites of a position source. The
+    # source provides track_between(name, timestamps) returning lats, lons and
+    # valid mask and orbit_period(name) in seconds. A track covers whole orbit
+    # windows around the current one, so it is only recomputed once per orbit.
+
+    def __init__(self, source, past_periods=1.0, future_periods=1.0,
+                 samples_per_period=SAMPLES_PER_PERIOD):
+        self.source = source
+        self.past_periods = past_periods
+        self.future_periods = future_periods
+        self.samples_per_period = samples_per_period
+        self.periods = {}
+        self.windows = {}
+        self.tracks = {}
+        self.recomputed = 0
+
+    def period(self, name):
+        if name not in self.periods:
+            self.periods[name] = self.source.orbit_period(name) or DEFAULT_PERIOD
+        return self.periods[name]
+
+    def compute(self, name, window, period):
+        start = (window - self.past_periods) * period
+        end = (window + 1 + self.future_periods) * period
+        count = int(math.ceil((end - start) / period * self.samples_per_period)) + 1
+        timestamps = np.linspace(start, end, count)
+        lats, lons, valid = self.source.track_between(name, timestamps)
+        # Gaps where the source has no positions break the track as well.
+        segments = []
+        breaks = np.flatnonzero(np.diff(valid.astype(np.int8)) != 0) + 1
+        for part_lats, part_lons, part_valid in zip(np.split(lats, breaks), np.split(lons, breaks),
+                                                    np.split(valid, breaks)):
+            if len(part_valid) and part_valid[0]:
+                segments.extend(split_antimeridian(part_lats, part_lons))
+        return segments
+
+    def update(self, names, timestamp):
+        # Returns True when a track changed since the last update.
+        changed = False
+        for name in names:
+            period = self.period(name)
+            window = math.floor(timestamp / period)
+            if self.windows.get(name) != window:
+                self.windows[name] = window
+                self.tracks[name] = self.compute(name, window, period)
+                self.recomputed += 1
+                changed = True
+        for name in set(self.tracks) - set(names):
+            del self.tracks[name]
+            del self.windows[name]
+            changed = True
+        return changed
+
+    def segments(self):
+        for segments in self.tracks.values():
+            yield from segments
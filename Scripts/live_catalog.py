@@ -0,0 +1,126 @@
+import time
+import numpy as np
+from sgp4.api import Satrec, SatrecArray
+from catalog import Catalog
+from proximity import haversine
+
+UNIX_EPOCH_JD = 2440587.5
+SECONDS_PER_DAY = 86400.0
+WGS84_RADIUS = 6378.137
+WGS84_FLATTENING = 1.0 / 298.257223563
+WGS84_E2 = WGS84_FLATTENING * (2.0 - WGS84_FLATTENING)
+
+
+def unix_to_jd(timestamps):
+    timestamps = np.atleast_1d(np.asarray(timestamps, dtype=np.float64))
+    days = np.floor(timestamps / SECONDS_PER_DAY)
+    return UNIX_EPOCH_JD + days, (timestamps - days * SECONDS_PER_DAY) / SECONDS_PER_DAY
+
+
+def gmst(jd, fr):
+    # Greenwich mean sidereal time in radians (IAU 1982), same formula as
+    # sgp4's gstime but on arrays. UTC is used in place of UT1.
+    t = (jd - 2451545.0 + fr) / 36525.0
+    seconds = (-6.2e-6 * t**3 + 0.093104 * t**2
+               + (876600.0 * 3600.0 + 8640184.812866) * t + 67310.54841)
+    return np.radians(seconds / 240.0) % (2.0 * np.pi)
+
+
+def teme_to_ecef(positions, jd, fr):
+    # positions are TEME vectors in km with shape (..., 3), times broadcast
+    # against the leading axes. Polar motion is ignored.
+    theta = gmst(jd, fr)
+    x = np.cos(theta) * positions[..., 0] + np.sin(theta) * positions[..., 1]
+    y = -np.sin(theta) * positions[..., 0] + np.cos(theta) * positions[..., 1]
+    return x, y, positions[..., 2]
+
+
+def teme_to_geodetic(positions, jd, fr):
+    x, y, z = teme_to_ecef(positions, jd, fr)
+    longitudes = np.degrees(np.arctan2(y, x))
+    radius = np.hypot(x, y)
+    latitudes = np.arctan2(z, radius)
+    for _ in range(3):
+        sin_lat = np.sin(latitudes)
+        curvature = WGS84_RADIUS / np.sqrt(1.0 - WGS84_E2 * sin_lat * sin_lat)
+        latitudes = np.arctan2(z + curvature * WGS84_E2 * sin_lat, radius)
+    return np.degrees(latitudes), longitudes
+
+
+class LiveCatalog:
+    # Propagates a whole TLE catalog with one SatrecArray call per update
+    # instead of reading pre-generated trace files. Interface follows
+    # Satellites, positions only holds highlighted satellites while all of
+    # them are available as lats and lons arrays.
+    batched = True
+    interpolate = True
+
+    def __init__(self, tle_file, position_class, highlight=None, cache_folder=None):
+        catalog = Catalog.load(tle_file, cache_folder)
+        print(f'Loaded {len(catalog)} satellites for live propagation')
+        self.names = catalog.names
+        models = [Satrec.twoline2rv(first, second) for first, second
+                  in zip(catalog.first_lines, catalog.second_lines)]
+        self.satrecs = SatrecArray(models)
+        self.highlight = []
+        for pattern in highlight or []:
+            self.highlight.extend(index for index in catalog.find(pattern)
+                                  if index not in self.highlight)
+        self.models = {self.names[index]: models[index] for index in self.highlight}
+        self.lats = np.zeros(len(self.names))
+        self.lons = np.zeros(len(self.names))
+        self.valid = np.zeros(len(self.names), dtype=bool)
+        self.positions = {}
+        self.position_class = position_class
+        self.clock_start = time.time()
+        self.clock_timestamp = self.clock_start
+
+    def propagate(self, timestamp):
+        jd, fr = unix_to_jd(timestamp)
+        errors, positions, _ = self.satrecs.sgp4(jd, fr)
+        lats, lons = teme_to_geodetic(positions[:, 0, :], jd[0], fr[0])
+        return lats, lons, errors[:, 0] == 0
+
+    def set_initial_readout(self, initial_timestamp=None, update_timestamps=True):
+        self.clock_start = time.time()
+        self.clock_timestamp = self.clock_start if initial_timestamp is None else initial_timestamp
+        self.update(0)
+
+    def current_timestamp(self):
+        return self.clock_timestamp + time.time() - self.clock_start
+
+    def update(self, dt):
+        timestamp = self.current_timestamp()
+        self.lats, self.lons, self.valid = self.propagate(timestamp)
+        for index in self.highlight:
+            if self.valid[index]:
+                self.positions[self.names[index]] = self.position_class(
+                    timestamp, float(self.lats[index]), float(self.lons[index]))
+
+    def time_until_update(self):
+        return 0
+
+    def resync(self, dropped):
+        # Positions are propagated for the wall clock, nothing lags behind.
+        pass
+
+    def orbit_period(self, name):
+        # Mean motion is in radians per minute.
+        return 2.0 * np.pi / self.models[name].no_kozai * 60.0
+
+    def track_between(self, name, timestamps):
+        jd, fr = unix_to_jd(timestamps)
+        errors, positions, _ = self.models[name].sgp4_array(jd, fr)
+        lats, lons = teme_to_geodetic(positions, jd, fr)
+        return lats, lons, errors == 0
+
+    def satellites_in_range(self, device_position, distance):
+        distances = haversine(device_position.lat, device_position.lon, self.lats, self.lons)
+        in_range = np.flatnonzero(self.valid & (distances <= distance))
+        return {self.names[index]: float(distances[index]) for index in in_range}
+
+    def is_satellite_in_range(self, device_position, distance):
+        return len(self.satellites_in_range(device_position, distance)) > 0
+
+    def cleanup(self):
+        pass
@@ -0,0 +1,149 @@
+import threading
+import time
+import serial
+
+MOCK_PORT = 'mock'
+
+# Values from Arduino/helmet/helmet.ino
+BAUD_RATE = 9600
+BITS_PER_BYTE = 10 # start bit, 8 data bits, stop bit
+RX_BUFFER_SIZE = 64 # SoftwareSerial receive buffer
+CZAS_OD_WLACZENIA = 10.0
+CZAS_DZIALANIA_POMPY = 300.0
+CZAS_OPOZNIENIA = 900.0
+CZAS_AKTYWACJA_SERWA = 120.0
+DEMO_DURATION = CZAS_OD_WLACZENIA + CZAS_DZIALANIA_POMPY + 2 * CZAS_OPOZNIENIA + CZAS_AKTYWACJA_SERWA
+
+PUMP_ENABLED = 'enabled'
+PUMP_HALTED = 'halted'
+PUMP_RELEASED = 'released'
+SERVO_REST = 'rest'
+SERVO_ACTIVE = 'active'
+# States set by auto_loop() and seconds after its start they are set at.
+DEMO_STEPS = ((CZAS_OD_WLACZENIA, PUMP_ENABLED, None),
+              (CZAS_OD_WLACZENIA + CZAS_DZIALANIA_POMPY, PUMP_RELEASED, None),
+              (CZAS_OD_WLACZENIA + CZAS_DZIALANIA_POMPY + CZAS_OPOZNIENIA, None, SERVO_ACTIVE),
+              (CZAS_OD_WLACZENIA + CZAS_DZIALANIA_POMPY + CZAS_OPOZNIENIA + CZAS_AKTYWACJA_SERWA,
+               None, SERVO_REST))
+
+
+class MockHelmetSerial:
+    # Stand-in for serial.Serial connected to the helmet. Writes take as long
+    # as they would at the configured baud rate and every received byte goes
+    # through the same command switch as read_command() in the firmware.
+
+    def __init__(self, port=MOCK_PORT, baudrate=BAUD_RATE, write_timeout=None,
+                 realtime=True, demo_duration=DEMO_DURATION):
+        self.port = port
+        self.baudrate = baudrate
+        self.write_timeout = write_timeout
+        self.realtime = realtime
+        self.demo_duration = demo_duration
+        self.byte_time = BITS_PER_BYTE / baudrate
+        self.lock = threading.Lock()
+        self.line_free_at = 0.0
+        self.busy_until = 0.0
+        self.rx_buffer = []
+        self.scheduled = []
+        self.pump = PUMP_RELEASED
+        self.servo = SERVO_REST
+        self.commands = []
+        self.transitions = []
+        self.lost = 0
+        self.timeouts = 0
+        self.start = time.monotonic()
+        self.is_open = True
+
+    def write(self, data):
+        written_at = time.monotonic()
+        with self.lock:
+            finish = max(written_at, self.line_free_at) + len(data) * self.byte_time
+            if self.write_timeout is not None and finish - written_at > self.write_timeout:
+                self.timeouts += 1
+                raise serial.SerialTimeoutException('Write timeout')
+            self.line_free_at = finish
+            for i, value in enumerate(data):
+                arrival = finish - (len(data) - i - 1) * self.byte_time
+                self.receive(bytes([value]), written_at, arrival)
+        if self.realtime:
+            delay = finish - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return len(data)
+
+    def receive(self, command, written_at, arrival):
+        # Bytes arriving while the demo runs wait in the receive buffer and
+        # are lost when it is full, like in SoftwareSerial.
+        self.process_buffer(arrival)
+        if arrival < self.busy_until:
+            if len(self.rx_buffer) >= RX_BUFFER_SIZE:
+                self.lost += 1
+            else:
+                self.rx_buffer.append((command, written_at))
+            return
+        self.handle(command, written_at, arrival)
+
+    def process_buffer(self, now):
+        while self.scheduled and now >= self.scheduled[0][0]:
+            at, pump, servo = self.scheduled.pop(0)
+            self.set_state(pump=pump, servo=servo, at=at)
+        while self.rx_buffer and now >= self.busy_until:
+            command, written_at = self.rx_buffer.pop(0)
+            self.handle(command, written_at, self.busy_until)
+
+    def handle(self, command, written_at, handled_at):
+        self.commands.append((command, written_at, handled_at))
+        if command == b'P':
+            self.set_state(pump=PUMP_ENABLED, at=handled_at)
+        elif command == b'L':
+            self.set_state(pump=PUMP_HALTED, at=handled_at)
+        elif command == b'S':
+            self.set_state(servo=SERVO_ACTIVE, at=handled_at)
+        elif command == b'Z':
+            self.set_state(servo=SERVO_REST, at=handled_at)
+        elif command == b'D':
+            # auto_loop() blocks the firmware while it steps through the demo,
+            # a shortened demo_duration scales the steps with it.
+            self.busy_until = handled_at + self.demo_duration
+            scale = self.demo_duration / DEMO_DURATION
+            self.scheduled = [(handled_at + offset * scale, pump, servo)
+                              for offset, pump, servo in DEMO_STEPS]
+        else:
+            # 'O' and every unknown byte end in release_pump()
+            self.set_state(pump=PUMP_RELEASED, at=handled_at)
+
+    def set_state(self, pump=None, servo=None, at=None):
+        pump = self.pump if pump is None else pump
+        servo = self.servo if servo is None else servo
+        if (pump, servo) != (self.pump, self.servo):
+            self.transitions.append((at - self.start, self.pump, self.servo, pump, servo))
+            self.pump = pump
+            self.servo = servo
+
+    def stats(self):
+        with self.lock:
+            self.process_buffer(time.monotonic())
+            elapsed = max(time.monotonic() - self.start, 1e-9)
+            latencies = [handled_at - written_at for _, written_at, handled_at in self.commands]
+            counts = {}
+            for command, _, _ in self.commands:
+                counts[command.decode()] = counts.get(command.decode(), 0) + 1
+            return {
+                'commands': len(self.commands),
+                'per_command': counts,
+                'rate': len(self.commands) / elapsed,
+                'mean_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+                'max_latency': max(latencies) if latencies else 0.0,
+                'transitions': len(self.transitions),
+                'buffered': len(self.rx_buffer),
+                'lost': self.lost,
+                'timeouts': self.timeouts,
+                'pump': self.pump,
+                'servo': self.servo,
+            }
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
@@ -0,0 +1,183 @@
+import numpy as np
+from live_catalog import WGS84_E2, WGS84_RADIUS, teme_to_ecef, unix_to_jd
+
+# Look angles of satellites seen from a place on the ground and rise,
+# culmination and set events derived from them. Events are stored in a small
+# npz file so the display can trigger on visibility without any geometry.
+RISE = 0
+CULMINATION = 1
+SET = 2
+EVENT_NAMES = ('rise', 'culmination', 'set')
+EVENT_DTYPE = np.dtype([('timestamp', '<f8'), ('satellite', '<u4'), ('kind', 'u1'),
+                        ('azimuth', '<f4'), ('elevation', '<f4'), ('range', '<f4')])
+# Satellite samples propagated at once, each one takes about 140 bytes
+# while a chunk is processed.
+CHUNK_ELEMENTS = 1 << 20
+
+
+def geodetic_to_ecef(lat, lon, height_km=0.0):
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    curvature = WGS84_RADIUS / np.sqrt(1.0 - WGS84_E2 * np.sin(lat)**2)
+    x = (curvature + height_km) * np.cos(lat) * np.cos(lon)
+    y = (curvature + height_km) * np.cos(lat) * np.sin(lon)
+    z = (curvature * (1.0 - WGS84_E2) + height_km) * np.sin(lat)
+    return np.array([x, y, z])
+
+
+class Observer:
+
+    def __init__(self, lat, lon, height_km=0.0):
+        self.lat = lat
+        self.lon = lon
+        self.height_km = height_km
+        self.position = geodetic_to_ecef(lat, lon, height_km)
+        sin_lat, cos_lat = np.sin(np.radians(lat)), np.cos(np.radians(lat))
+        sin_lon, cos_lon = np.sin(np.radians(lon)), np.cos(np.radians(lon))
+        # Rows are east, north and up unit vectors in earth fixed frame.
+        self.enu = np.array([[-sin_lon, cos_lon, 0.0],
+                             [-sin_lat * cos_lon, -sin_lat * sin_lon, cos_lat],
+                             [cos_lat * cos_lon, cos_lat * sin_lon, sin_lat]])
+
+    def look_angles(self, x, y, z):
+        # Azimuth and elevation in degrees and range in km of earth fixed
+        # positions, works on arrays of any shape.
+        dx = x - self.position[0]
+        dy = y - self.position[1]
+        dz = z - self.position[2]
+        east = self.enu[0, 0] * dx + self.enu[0, 1] * dy
+        north = self.enu[1, 0] * dx + self.enu[1, 1] * dy + self.enu[1, 2] * dz
+        up = self.enu[2, 0] * dx + self.enu[2, 1] * dy + self.enu[2, 2] * dz
+        distance = np.sqrt(dx * dx + dy * dy + dz * dz)
+        azimuth = np.degrees(np.arctan2(east, north)) % 360.0
+        elevation = np.degrees(np.arcsin(up / distance))
+        return azimuth, elevation, distance
+
+    def satellite_look_angles(self, satrecs, timestamps):
+        # satrecs is a SatrecArray, returned arrays have shape (satellites,
+        # times). Positions that failed to propagate get elevation of -90.
+        jd, fr = unix_to_jd(timestamps)
+        errors, positions, _ = satrecs.sgp4(jd, fr)
+        azimuth, elevation, distance = self.look_angles(*teme_to_ecef(positions, jd, fr))
+        elevation[errors != 0] = -90.0
+        return azimuth, elevation, distance
+
+
+class VisibilityEvents:
+    # Finds events chunk by chunk, so a whole day of a large catalog never
+    # has to be in memory. The last two samples of a chunk are kept, crossings
+    # and peaks on the border are found with the next one.
+
+    def __init__(self, min_elevation=0.0):
+        self.min_elevation = min_elevation
+        self.previous = None
+        self.events = []
+
+    def add(self, kind, satellites, timestamps, azimuth, elevation, distance):
+        events = np.empty(len(satellites), dtype=EVENT_DTYPE)
+        events['satellite'] = satellites
+        events['kind'] = kind
+        events['timestamp'] = timestamps
+        events['azimuth'] = azimuth
+        events['elevation'] = elevation
+        events['range'] = distance
+        self.events.append(events)
+
+    def update(self, timestamps, azimuth, elevation, distance):
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if self.previous is None:
+            above = np.flatnonzero(elevation[:, 0] >= self.min_elevation)
+            self.add(RISE, above, timestamps[0], azimuth[above, 0], elevation[above, 0],
+                     distance[above, 0])
+            first = 0
+        else:
+            previous_times, previous_azimuth, previous_elevation, previous_distance = self.previous
+            first = previous_elevation.shape[1] - 1
+            timestamps = np.concatenate((previous_times, timestamps))
+            azimuth = np.concatenate((previous_azimuth, azimuth), axis=1)
+            elevation = np.concatenate((previous_elevation, elevation), axis=1)
+            distance = np.concatenate((previous_distance, distance), axis=1)
+        above = elevation >= self.min_elevation
+        # Crossing between samples j and j + 1, refined by linear interpolation.
+        satellites, j = np.nonzero(above[:, first + 1:] != above[:, first:-1])
+        j += first
+        fraction = ((self.min_elevation - elevation[satellites, j])
+                    / (elevation[satellites, j + 1] - elevation[satellites, j]))
+        times = timestamps[j] + (timestamps[j + 1] - timestamps[j]) * fraction
+        rising = above[satellites, j + 1]
+        azimuths = azimuth[satellites, j] + ((azimuth[satellites, j + 1] - azimuth[satellites, j]
+                                              + 180.0) % 360.0 - 180.0) * fraction
+        distances = distance[satellites, j] + (distance[satellites, j + 1] - distance[satellites, j]) * fraction
+        for kind, mask in ((RISE, rising), (SET, ~rising)):
+            self.add(kind, satellites[mask], times[mask], azimuths[mask] % 360.0,
+                     np.full(mask.sum(), self.min_elevation), distances[mask])
+        # Culmination is a local maximum above the horizon, refined with a
+        # parabola through the three samples around it.
+        first_peak = max(first, 1)
+        if elevation.shape[1] - first_peak > 1:
+            middle = elevation[:, first_peak:-1]
+            peaks = ((middle > elevation[:, first_peak - 1:-2]) & (middle >= elevation[:, first_peak + 1:])
+                     & above[:, first_peak:-1])
+            satellites, j = np.nonzero(peaks)
+            j += first_peak
+            before, at, after = (elevation[satellites, j - 1], elevation[satellites, j],
+                                 elevation[satellites, j + 1])
+            curvature = before - 2.0 * at + after
+            offset = np.divide(0.5 * (before - after), curvature, out=np.zeros(len(j)),
+                               where=curvature != 0)
+            step = timestamps[j + 1] - timestamps[j]
+            self.add(CULMINATION, satellites, timestamps[j] + offset * step,
+                     azimuth[satellites, j], at - 0.25 * (before - after) * offset,
+                     distance[satellites, j])
+        self.previous = (timestamps[-2:], azimuth[:, -2:], elevation[:, -2:], distance[:, -2:])
+
+    def finish(self):
+        # Satellites still above at the end get a set event at the last sample.
+        if self.previous is not None:
+            timestamps, azimuth, elevation, distance = self.previous
+            above = np.flatnonzero(elevation[:, -1] >= self.min_elevation)
+            self.add(SET, above, timestamps[-1], azimuth[above, -1], elevation[above, -1],
+                     distance[above, -1])
+        if not self.events:
+            return np.empty(0, dtype=EVENT_DTYPE)
+        events = np.concatenate(self.events)
+        return events[np.lexsort((events['kind'], events['timestamp']))]
+
+
+def find_events(satrecs, observer, start, count, step=1.0, min_elevation=0.0,
+                chunk_elements=CHUNK_ELEMENTS):
+    # Events of all satellites of a SatrecArray in count samples step seconds
+    # apart from unix timestamp start. Chunks hold about chunk_elements
+    # satellite samples, so memory does not grow with the catalog.
+    chunk_size = max(2, chunk_elements // max(len(satrecs), 1))
+    events = VisibilityEvents(min_elevation)
+    for first in range(0, count, chunk_size):
+        timestamps = start + np.arange(first, min(first + chunk_size, count)) * step
+        events.update(timestamps, *observer.satellite_look_angles(satrecs, timestamps))
+    return events.finish()
+
+
+def write_events(path, names, events, observer, min_elevation):
+    np.savez_compressed(path, names=np.array(names), events=events,
+                        observer=np.array([observer.lat, observer.lon, observer.height_km]),
+                        min_elevation=np.array(min_elevation))
+
+
+def load_events(path):
+    with np.load(path) as data:
+        return (data['names'].tolist(), data['events'], tuple(data['observer'].tolist()),
+                float(data['min_elevation']))
+
+
+def events_to_passes(names, events):
+    # Pairs rise and set events of every satellite into (rise, set) tuples as
+    # used by passes.PassSchedule.
+    passes = {}
+    rises = {}
+    for timestamp, satellite, kind in zip(events['timestamp'].tolist(), events['satellite'].tolist(),
+                                          events['kind'].tolist()):
+        if kind == RISE:
+            rises[satellite] = timestamp
+        elif kind == SET and satellite in rises:
+            passes.setdefault(names[satellite], []).append((rises.pop(satellite), timestamp))
+    return passes
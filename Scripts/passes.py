@@ -0,0 +1,74 @@
+import bisect
+import numpy as np
+from proximity import haversine
+
+
+def find_passes(timestamps, lats, lons, device_lat, device_lon, radius):
+    # Distance to the alert circle is evaluated for the whole trace at once,
+    # crossings are then refined by linear interpolation between the samples
+    # on both sides of every sign change.
+    if len(timestamps) == 0:
+        return []
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    margin = haversine(device_lat, device_lon, np.asarray(lats), np.asarray(lons)) - radius
+    inside = margin <= 0
+    changes = np.flatnonzero(inside[1:] != inside[:-1])
+    before = margin[changes]
+    after = margin[changes + 1]
+    fraction = before / (before - after)
+    crossings = timestamps[changes] + (timestamps[changes + 1] - timestamps[changes]) * fraction
+    entries = list(crossings[~inside[changes]])
+    exits = list(crossings[inside[changes]])
+    if inside[0]:
+        entries.insert(0, timestamps[0])
+    if inside[-1]:
+        exits.append(timestamps[-1])
+    return [(float(entry), float(exit)) for entry, exit in zip(entries, exits)]
+
+
+class PassSchedule:
+
+    def __init__(self, passes, start=None):
+        # passes maps satellite names to lists of (entry, exit), overlapping
+        # passes are merged so every interval means "at least one in range".
+        events = sorted((entry, exit, name) for name, sat_passes in passes.items()
+                        for entry, exit in sat_passes if start is None or exit >= start)
+        self.intervals = []
+        for entry, exit, name in events:
+            if self.intervals and entry <= self.intervals[-1][1]:
+                last = self.intervals[-1]
+                last[1] = max(last[1], exit)
+                last[2].add(name)
+            else:
+                self.intervals.append([entry, exit, {name}])
+        self.ends = [interval[1] for interval in self.intervals]
+        self.index = 0
+        self.last_timestamp = None
+
+    def advance(self, timestamp):
+        # Time normally only moves forward, so the pointer moves by at most a
+        # few intervals per frame. Going back in time falls back to bisect.
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            self.index = bisect.bisect_left(self.ends, timestamp)
+        self.last_timestamp = timestamp
+        while self.index < len(self.intervals) and self.intervals[self.index][1] < timestamp:
+            self.index += 1
+
+    def active_satellites(self, timestamp):
+        self.advance(timestamp)
+        if self.index < len(self.intervals) and self.intervals[self.index][0] <= timestamp:
+            return self.intervals[self.index][2]
+        return set()
+
+    def is_active(self, timestamp):
+        return len(self.active_satellites(timestamp)) > 0
+
+    def next_change(self, timestamp):
+        self.advance(timestamp)
+        if self.index >= len(self.intervals):
+            return None
+        entry, exit, _ = self.intervals[self.index]
+        return exit if entry <= timestamp else entry
+
+    def __len__(self):
+        return len(self.intervals)
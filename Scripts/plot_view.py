@@ -0,0 +1,53 @@
+import pygame
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Map drawn by matplotlib into a persistent Agg canvas. The figure, backdrop
+# and static artists are rendered once and saved as background, each frame
+# only restores it and draws the moving artists. The pygame surface wraps
+# the Agg buffer itself, so it shows every update without conversion.
+
+
+class BlittedMapView:
+
+    def __init__(self, image, size=(800, 400), dpi=100, extent=(-180, 180, -90, 90),
+                 marker_style='ro', track_style='r-'):
+        self.size = size
+        self.extent = extent
+        self.figure = Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_axes((0, 0, 1, 1))
+        self.axes.set_axis_off()
+        self.axes.imshow(image, extent=extent)
+        self.axes.set_xlim(extent[0], extent[1])
+        self.axes.set_ylim(extent[2], extent[3])
+        self.track_style = track_style
+        self.track_artists = []
+        self.marker, = self.axes.plot([], [], marker_style, linestyle='none', animated=True)
+        self.background = None
+        self.surface = None
+        self.render_background()
+
+    def render_background(self):
+        # Animated artists are skipped by a full draw, so the saved
+        # background holds the map and tracks only.
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        # Renderer and its buffer stay the same while size and dpi do.
+        self.buffer = self.canvas.buffer_rgba()
+        self.surface = pygame.image.frombuffer(self.buffer, self.canvas.get_width_height(), 'RGBA')
+
+    def set_tracks(self, segments):
+        # Segments are (lats, lons) pairs, e.g. from ground_track.split_antimeridian.
+        for artist in self.track_artists:
+            artist.remove()
+        self.track_artists = [self.axes.plot(lons, lats, self.track_style)[0]
+                              for lats, lons in segments]
+        self.render_background()
+
+    def update(self, lats, lons):
+        # Returns surface showing the markers at given positions.
+        self.canvas.restore_region(self.background)
+        self.marker.set_data(lons, lats)
+        self.axes.draw_artist(self.marker)
+        return self.surface
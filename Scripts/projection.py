@@ -0,0 +1,197 @@
+import math
+import numpy as np
+
+# Define the Mercator projection bounds
+MAX_LONGITUDE = 180.0
+MIN_LONGITUDE = -180.0
+MAX_LATITUDE = 85.051129
+MIN_LATITUDE = -85.051129
+
+
+def mercator_projection(longitude, latitude):
+    # Clamp the longitude and latitude within the bounds
+    longitude = max(min(longitude, MAX_LONGITUDE), MIN_LONGITUDE)
+    latitude = max(min(latitude, MAX_LATITUDE), MIN_LATITUDE)
+
+    # Convert latitude and longitude to radians
+    lat_rad = math.radians(latitude)
+
+    # Perform the Mercator projection
+    x = (longitude + 180.0) / 360.0
+    y = (1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0
+
+    return x, y
+
+
+def mercator_projection_array(longitudes, latitudes):
+    longitudes = np.clip(np.asarray(longitudes, dtype=np.float64), MIN_LONGITUDE, MAX_LONGITUDE)
+    lat_rad = np.radians(np.clip(np.asarray(latitudes, dtype=np.float64), MIN_LATITUDE, MAX_LATITUDE))
+    x = (longitudes + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0
+    return x, y
+
+
+class MercatorLookup:
+    # Latitude -> y table sampled finely enough for the display height, so
+    # projecting is an index computation instead of tan/cos/log.
+
+    def __init__(self, height, samples_per_pixel=4, interpolate=True):
+        self.samples = int(max(height, 1) * samples_per_pixel) + 1
+        self.step = (MAX_LATITUDE - MIN_LATITUDE) / (self.samples - 1)
+        latitudes = MIN_LATITUDE + np.arange(self.samples) * self.step
+        _, self.table = mercator_projection_array(np.zeros(self.samples), latitudes)
+        self.interpolate = interpolate
+
+    def y(self, latitudes):
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        finite = np.isfinite(latitudes)
+        index = (np.clip(np.where(finite, latitudes, 0.0), MIN_LATITUDE, MAX_LATITUDE)
+                 - MIN_LATITUDE) / self.step
+        if not self.interpolate:
+            y = self.table[np.rint(index).astype(np.intp)]
+        else:
+            lower = np.minimum(index.astype(np.intp), self.samples - 2)
+            fraction = index - lower
+            y = self.table[lower] + (self.table[lower + 1] - self.table[lower]) * fraction
+        return np.where(finite, y, np.nan)
+
+
+class Projection:
+    # Forward maps lat/lon to map coordinates in [0, 1] with y going down,
+    # inverse maps them back. Points that can not be shown are NaN.
+    name = None
+
+    def forward(self, latitudes, longitudes):
+        raise NotImplementedError
+
+    def inverse(self, x, y):
+        raise NotImplementedError
+
+    def key(self):
+        return self.name
+
+
+class Equirectangular(Projection):
+    name = 'equirectangular'
+
+    def forward(self, latitudes, longitudes):
+        longitudes = np.clip(np.asarray(longitudes, dtype=np.float64), MIN_LONGITUDE, MAX_LONGITUDE)
+        latitudes = np.clip(np.asarray(latitudes, dtype=np.float64), -90.0, 90.0)
+        return (longitudes + 180.0) / 360.0, (90.0 - latitudes) / 180.0
+
+    def inverse(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        outside = (x < 0) | (x > 1) | (y < 0) | (y > 1)
+        return np.where(outside, np.nan, 90.0 - y * 180.0), np.where(outside, np.nan, x * 360.0 - 180.0)
+
+
+class Mercator(Projection):
+    name = 'mercator'
+
+    def forward(self, latitudes, longitudes):
+        return mercator_projection_array(longitudes, latitudes)
+
+    def inverse(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        outside = (x < 0) | (x > 1) | (y < 0) | (y > 1)
+        latitudes = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * y))))
+        return np.where(outside, np.nan, latitudes), np.where(outside, np.nan, x * 360.0 - 180.0)
+
+
+class Orthographic(Projection):
+    # Globe seen from infinity above center, far hemisphere is not visible.
+    name = 'orthographic'
+
+    def __init__(self, center=(0.0, 0.0)):
+        self.center = center
+        self.lat0 = math.radians(center[0])
+        self.lon0 = math.radians(center[1])
+
+    def key(self):
+        return f'{self.name}_{self.center[0]:g}_{self.center[1]:g}'
+
+    def forward(self, latitudes, longitudes):
+        lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+        delta = np.radians(np.asarray(longitudes, dtype=np.float64)) - self.lon0
+        cos_c = math.sin(self.lat0) * np.sin(lat) + math.cos(self.lat0) * np.cos(lat) * np.cos(delta)
+        x = np.cos(lat) * np.sin(delta)
+        y = math.cos(self.lat0) * np.sin(lat) - math.sin(self.lat0) * np.cos(lat) * np.cos(delta)
+        hidden = cos_c < 0
+        return np.where(hidden, np.nan, 0.5 + x / 2.0), np.where(hidden, np.nan, 0.5 - y / 2.0)
+
+    def inverse(self, x, y):
+        x = 2.0 * np.asarray(x, dtype=np.float64) - 1.0
+        y = 1.0 - 2.0 * np.asarray(y, dtype=np.float64)
+        rho = np.sqrt(x * x + y * y)
+        outside = rho > 1.0
+        c = np.arcsin(np.minimum(rho, 1.0))
+        safe_rho = np.where(rho == 0, 1.0, rho)
+        lat = np.arcsin(np.clip(np.cos(c) * math.sin(self.lat0)
+                                + y * np.sin(c) * math.cos(self.lat0) / safe_rho, -1.0, 1.0))
+        lon = self.lon0 + np.arctan2(x * np.sin(c),
+                                     rho * np.cos(c) * math.cos(self.lat0) - y * np.sin(c) * math.sin(self.lat0))
+        lon = (np.degrees(lon) + 180.0) % 360.0 - 180.0
+        return np.where(outside, np.nan, np.degrees(lat)), np.where(outside, np.nan, lon)
+
+
+PROJECTIONS = {
+    Equirectangular.name: Equirectangular,
+    Mercator.name: Mercator,
+    Orthographic.name: Orthographic,
+}
+
+
+def create_projection(name, center=None):
+    if name == Orthographic.name:
+        return Orthographic(center if center is not None else (0.0, 0.0))
+    return PROJECTIONS[name]()
+
+
+def warp_image(pixels, source, target, size):
+    # pixels is a (width, height, 3) array in source projection, every target
+    # pixel center is mapped back through target.inverse and source.forward
+    # and sampled from the nearest source pixel. Pixels off the map are black.
+    width, height = size
+    x = (np.arange(width) + 0.5) / width
+    y = (np.arange(height) + 0.5) / height
+    x, y = np.meshgrid(x, y, indexing='ij')
+    latitudes, longitudes = target.inverse(x, y)
+    source_x, source_y = source.forward(latitudes, longitudes)
+    visible = np.isfinite(source_x) & np.isfinite(source_y)
+    source_width, source_height = pixels.shape[:2]
+    columns = np.clip(np.nan_to_num(source_x) * source_width, 0, source_width - 1).astype(np.intp)
+    rows = np.clip(np.nan_to_num(source_y) * source_height, 0, source_height - 1).astype(np.intp)
+    warped = pixels[columns, rows]
+    warped[~visible] = 0
+    return warped
+
+
+class ScreenProjection:
+    # Converts arrays of positions to pixels of a map drawn at position with size.
+
+    def __init__(self, position, size, projection=None, lookup=True, interpolate=True):
+        self.position = position
+        self.size = size
+        self.projection = projection if projection is not None else Mercator()
+        self.lookup = None
+        if lookup and isinstance(self.projection, Mercator):
+            self.lookup = MercatorLookup(size[1], interpolate=interpolate)
+
+    def project(self, latitudes, longitudes):
+        # Returns pixel columns, rows and mask of points visible in the projection.
+        if self.lookup is None:
+            x, y = self.projection.forward(latitudes, longitudes)
+        else:
+            x = (np.clip(np.asarray(longitudes, dtype=np.float64), MIN_LONGITUDE, MAX_LONGITUDE) + 180.0) / 360.0
+            y = self.lookup.y(latitudes)
+        visible = np.isfinite(x) & np.isfinite(y)
+        x = (np.where(visible, x, 0.0) * self.size[0] + self.position[0]).astype(np.intp)
+        y = (np.where(visible, y, 0.0) * self.size[1] + self.position[1]).astype(np.intp)
+        return x, y, visible
+
+    def unproject(self, x, y):
+        x = (np.asarray(x, dtype=np.float64) - self.position[0]) / self.size[0]
+        y = (np.asarray(y, dtype=np.float64) - self.position[1]) / self.size[1]
+        return self.projection.inverse(x, y)
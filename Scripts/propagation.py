@@ -0,0 +1,85 @@
+from skyfield.api import load
+
+# load.timescale() reads the leap second and Delta T tables on every call,
+# so scripts share one timescale per process and reuse converted times.
+shared_timescale = None
+# A used array Time takes about 6 MB per 3600 samples.
+SAMPLE_BYTES = 1750
+CACHE_BYTES = 128 * 2**20
+
+
+def timescale():
+    global shared_timescale
+    if shared_timescale is None:
+        shared_timescale = load.timescale()
+    return shared_timescale
+
+
+class PropagationContext:
+    # Converts datetimes to skyfield Time once and propagates satellites at
+    # them. Times are built from calendar fields, so results match a scalar
+    # ts.utc call for the same datetime. A cached Time also keeps its nutation
+    # and precession matrices, which cost more than SGP4 itself, so every
+    # satellite after the first one at the same times gets them for free.
+    # The cache is bounded by the estimated bytes of the times it holds,
+    # so long chunks take more of it. Satellites walk the same chunks in
+    # order, which would make an LRU evict every chunk just before it is
+    # needed again, so a full cache keeps what it has and only new times
+    # are converted without caching.
+
+    def __init__(self, ts=None, max_bytes=CACHE_BYTES):
+        self.ts = ts if ts is not None else timescale()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.cached = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key, convert, samples=1, cache=True):
+        time = self.cached.get(key)
+        if time is not None:
+            self.hits += 1
+            return time
+        self.misses += 1
+        time = convert()
+        size = samples * SAMPLE_BYTES
+        if cache and self.size + size <= self.max_bytes:
+            self.cached[key] = time
+            self.size += size
+        return time
+
+    def time(self, moment):
+        return self.lookup(moment, lambda: self.ts.utc(moment.year, moment.month, moment.day,
+                                                       moment.hour, moment.minute, moment.second))
+
+    def times(self, moments, cache=True):
+        # Chunks of a time domain repeat for every satellite in a run, times
+        # used only once should pass cache=False to leave room for them.
+        key = tuple(moments)
+        return self.lookup(key, lambda: self.ts.utc(
+            [t.year for t in moments], [t.month for t in moments], [t.day for t in moments],
+            [t.hour for t in moments], [t.minute for t in moments], [t.second for t in moments]),
+            len(moments), cache)
+
+    def subpoint(self, satellite, moment):
+        subpoint = satellite.at(self.time(moment)).subpoint()
+        return subpoint.latitude.degrees, subpoint.longitude.degrees
+
+    def subpoints(self, satellite, moments, cache=True):
+        subpoint = satellite.at(self.times(moments, cache)).subpoint()
+        return subpoint.latitude.degrees, subpoint.longitude.degrees
+
+    def stats(self):
+        return {'size': len(self.cached), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses}
+
+
+shared_context = None
+
+
+def context(max_bytes=CACHE_BYTES):
+    # max_bytes only applies to the first call of a process.
+    global shared_context
+    if shared_context is None:
+        shared_context = PropagationContext(max_bytes=max_bytes)
+    return shared_context
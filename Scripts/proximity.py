@@ -0,0 +1,86 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    # Great circle distance in kilometres, works on scalars and arrays.
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0)**2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class ProximityIndex:
+    # Buckets objects in a latitude/longitude grid. A query only visits cells
+    # that can intersect the spherical cap around the query point, so the
+    # cost depends on the local density and not on the number of objects.
+
+    def __init__(self, cell_size=5.0):
+        self.cell_size = cell_size
+        self.rows = math.ceil(180.0 / cell_size)
+        self.columns = math.ceil(360.0 / cell_size)
+        self.cells = {}
+        self.entries = {}
+
+    def cell_of(self, lat, lon):
+        row = min(int((lat + 90.0) // self.cell_size), self.rows - 1)
+        column = int(((lon + 180.0) % 360.0) // self.cell_size) % self.columns
+        return row, column
+
+    def update(self, name, lat, lon):
+        cell = self.cell_of(lat, lon)
+        previous = self.entries.get(name)
+        if previous is not None and previous[2] != cell:
+            self.discard_from_cell(name, previous[2])
+        if previous is None or previous[2] != cell:
+            self.cells.setdefault(cell, set()).add(name)
+        self.entries[name] = (lat, lon, cell)
+
+    def remove(self, name):
+        previous = self.entries.pop(name, None)
+        if previous is not None:
+            self.discard_from_cell(name, previous[2])
+
+    def discard_from_cell(self, name, cell):
+        bucket = self.cells[cell]
+        bucket.discard(name)
+        if not bucket:
+            del self.cells[cell]
+
+    def candidate_cells(self, lat, lon, radius):
+        angle = radius / EARTH_RADIUS_KM
+        angle_deg = math.degrees(angle)
+        first_row = self.cell_of(max(lat - angle_deg, -90.0), 0.0)[0]
+        last_row = self.cell_of(min(lat + angle_deg, 90.0), 0.0)[0]
+        # Longitude half width of a spherical cap, the cap covers every
+        # longitude when it reaches a pole.
+        ratio = math.sin(angle) / max(math.cos(math.radians(lat)), 1e-12)
+        if lat + angle_deg >= 90.0 or lat - angle_deg <= -90.0 or angle >= math.pi / 2 or ratio >= 1.0:
+            columns = range(self.columns)
+        else:
+            width = math.degrees(math.asin(ratio))
+            first_column = int((lon - width + 180.0) // self.cell_size)
+            last_column = int((lon + width + 180.0) // self.cell_size)
+            if last_column - first_column + 1 >= self.columns:
+                columns = range(self.columns)
+            else:
+                columns = [column % self.columns for column in range(first_column, last_column + 1)]
+        for row in range(first_row, last_row + 1):
+            for column in columns:
+                cell = (row, column)
+                if cell in self.cells:
+                    yield cell
+
+    def query(self, lat, lon, radius):
+        names = []
+        for cell in self.candidate_cells(lat, lon, radius):
+            names.extend(self.cells[cell])
+        if not names:
+            return {}
+        positions = np.array([self.entries[name][:2] for name in names])
+        distances = haversine(lat, lon, positions[:, 0], positions[:, 1])
+        return {name: float(distance) for name, distance in zip(names, distances) if distance <= radius}
+
+    def any_within(self, lat, lon, radius):
+        return len(self.query(lat, lon, radius)) > 0
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Scripts import each other by module name, like when run from Scripts.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
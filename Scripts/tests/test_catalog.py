@@ -0,0 +1,36 @@
+import pytest
+from catalog import Catalog, designator_key, parse_tle_lines
+
+TLE_LINES = """NOAA 15
+1 25338U 98030A   23182.11656475  .00000217  00000+0  10827-3 0  9992
+2 25338  98.6046 210.9345 0009112 273.3992  86.6145 14.26343848307247
+ISS (ZARYA)
+1 25544U 98067A   23182.18894313  .00014575  00000+0  25754-3 0  9990
+2 25544  51.6418 259.1154 0004762  93.3659  11.7905 15.50581131403963
+""".splitlines()
+
+
+@pytest.fixture
+def catalog():
+    return Catalog(*parse_tle_lines(TLE_LINES))
+
+
+@pytest.mark.parametrize('designator', ['98067A', '1998-067A', '1998 067A', '98-067a', ' 98067A  '])
+def test_designator_forms(designator):
+    assert designator_key(designator) == '98067A'
+
+
+@pytest.mark.parametrize('name', ['NOAA-15', 'NOAA 15', 'noaa_15', 'ISS (ZARYA)', '25544', 'NOAA-1998'])
+def test_names_are_not_designators(name):
+    assert designator_key(name) is None
+
+
+@pytest.mark.parametrize('pattern, expected', [
+    ('NOAA 15', 0), ('NOAA-15', 0), ('noaa_15', 0), ('1998-030A', 0), ('98030A', 0), ('25338', 0),
+    ('ISS (ZARYA)', 1), ('1998-067A', 1), ('25544', 1)])
+def test_find(catalog, pattern, expected):
+    assert catalog.find(pattern) == [expected]
+
+
+def test_find_missing(catalog):
+    assert catalog.find('NOAA-19') == []
@@ -0,0 +1,114 @@
+import threading
+import time
+import pytest
+from mock_helmet import (DEMO_DURATION, MOCK_PORT, PUMP_ENABLED, PUMP_RELEASED, RX_BUFFER_SIZE,
+                         SERVO_ACTIVE, SERVO_REST, MockHelmetSerial)
+from visualization import Helmet
+
+
+def wait_written(helmet, count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while helmet.sent + helmet.dropped < count:
+        assert time.monotonic() < deadline, helmet.stats()
+        time.sleep(0.001)
+
+
+def pause_writer(helmet):
+    helmet.running = False
+    helmet.wakeup.set()
+    helmet.writer.join()
+
+
+def resume_writer(helmet):
+    helmet.running = True
+    helmet.writer = threading.Thread(target=helmet.write_loop, daemon=True)
+    helmet.writer.start()
+
+
+@pytest.fixture
+def helmet():
+    helmet = Helmet(MOCK_PORT)
+    yield helmet
+    helmet.cleanup(timeout=5.0)
+
+
+def handled(helmet):
+    return [command for command, _, _ in helmet.serial.commands]
+
+
+def test_only_state_changes_are_written(helmet):
+    for _ in range(5):
+        helmet.activate_pump()
+        helmet.deactivate_servo()
+    wait_written(helmet, 2)
+    helmet.activate_pump()
+    helmet.stop_pump()
+    wait_written(helmet, 3)
+    assert handled(helmet) == [b'P', b'Z', b'L']
+    assert helmet.skipped == 9
+    assert helmet.serial.pump == 'halted'
+    assert helmet.serial.servo == SERVO_REST
+
+
+def test_newer_command_replaces_queued_one(helmet):
+    pause_writer(helmet)
+    helmet.activate_pump()
+    helmet.stop_pump()
+    helmet.release_pump()
+    helmet.activate_servo()
+    assert helmet.coalesced == 2
+    resume_writer(helmet)
+    wait_written(helmet, 2)
+    assert handled(helmet) == [b'O', b'S']
+
+
+def test_timed_out_writes_are_dropped_and_resent():
+    helmet = Helmet(MOCK_PORT, write_timeout=0.0)
+    try:
+        helmet.activate_pump()
+        wait_written(helmet, 1)
+        # The dropped command is forgotten, so the same state is sent again.
+        helmet.activate_pump()
+        wait_written(helmet, 2)
+        assert helmet.dropped == 2
+        assert helmet.sent == 0
+        assert helmet.skipped == 0
+        assert helmet.serial.timeouts == 2
+        assert handled(helmet) == []
+    finally:
+        helmet.cleanup(timeout=5.0)
+
+
+def test_commands_are_lost_while_demo_runs(helmet):
+    helmet.play_demo()
+    wait_written(helmet, 1)
+    extra = 6
+    for i in range(RX_BUFFER_SIZE + extra):
+        if i % 2 == 0:
+            helmet.activate_pump()
+        else:
+            helmet.stop_pump()
+        wait_written(helmet, i + 2)
+    stats = helmet.serial.stats()
+    assert handled(helmet) == [b'D']
+    assert stats['buffered'] == RX_BUFFER_SIZE
+    assert stats['lost'] == extra
+    assert helmet.sent == RX_BUFFER_SIZE + extra + 1
+
+
+def test_demo_steps_follow_firmware():
+    mock = MockHelmetSerial(realtime=False)
+    mock.write(b'D')
+    mock.write(b'S')
+    handled_at = mock.commands[0][2]
+    expected = [(5.0, PUMP_RELEASED, SERVO_REST), (11.0, PUMP_ENABLED, SERVO_REST),
+                (311.0, PUMP_RELEASED, SERVO_REST), (1211.0, PUMP_RELEASED, SERVO_ACTIVE),
+                (1331.0, PUMP_RELEASED, SERVO_REST)]
+    for offset, pump, servo in expected:
+        mock.process_buffer(handled_at + offset)
+        assert (mock.pump, mock.servo) == (pump, servo)
+    assert [round(at - (handled_at - mock.start)) for at, *_ in mock.transitions] == [10, 310, 1210, 1330]
+    # Buffered command is handled once the demo ends.
+    mock.process_buffer(handled_at + DEMO_DURATION)
+    assert [command for command, _, _ in mock.commands] == [b'D', b'S']
+    assert mock.servo == SERVO_ACTIVE
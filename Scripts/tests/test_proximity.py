@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from proximity import ProximityIndex, haversine
+
+
+def brute_force(points, lat, lon, radius):
+    names = list(points)
+    positions = np.array([points[name] for name in names])
+    distances = haversine(lat, lon, positions[:, 0], positions[:, 1])
+    return {name for name, distance in zip(names, distances) if distance <= radius}
+
+
+@pytest.fixture
+def points():
+    generator = np.random.default_rng(9)
+    points = {f'random {i}': (float(lat), float(lon)) for i, (lat, lon) in
+              enumerate(zip(np.degrees(np.arcsin(generator.uniform(-1.0, 1.0, 2000))),
+                            generator.uniform(-180.0, 180.0, 2000)))}
+    # Points on both sides of the antimeridian and around the poles.
+    for lat in (-90.0, -89.9, -88.0, 0.0, 45.0, 88.0, 89.9, 90.0):
+        for lon in (-180.0, -179.9, 179.9, 180.0, 0.0, 90.0):
+            points[f'edge {lat} {lon}'] = (lat, lon)
+    return points
+
+
+@pytest.mark.parametrize('cell_size', [1.0, 5.0, 30.0])
+@pytest.mark.parametrize('lat, lon', [(0.0, 180.0), (0.0, -179.95), (60.0, 179.5), (-45.0, -180.0),
+                                      (90.0, 0.0), (89.95, 123.0), (-89.5, -60.0), (52.2, 21.0)])
+@pytest.mark.parametrize('radius', [10.0, 300.0, 2500.0, 12000.0])
+def test_query_matches_brute_force(points, cell_size, lat, lon, radius):
+    index = ProximityIndex(cell_size)
+    for name, (point_lat, point_lon) in points.items():
+        index.update(name, point_lat, point_lon)
+    found = index.query(lat, lon, radius)
+    assert set(found) == brute_force(points, lat, lon, radius)
+    assert index.any_within(lat, lon, radius) == bool(found)
+
+
+def test_update_and_remove_move_between_cells():
+    index = ProximityIndex(5.0)
+    index.update('sat', 0.0, 179.9)
+    index.update('sat', 0.0, -179.9)
+    assert set(index.query(0.0, -180.0, 50.0)) == {'sat'}
+    index.update('sat', 89.9, 0.0)
+    assert index.query(0.0, -180.0, 50.0) == {}
+    assert set(index.query(89.9, 180.0, 50.0)) == {'sat'}
+    index.remove('sat')
+    assert index.query(89.9, 180.0, 50.0) == {}
+    assert index.cells == {}
@@ -0,0 +1,154 @@
+import argparse
+import datetime
+import glob
+import hashlib
+import os
+import shutil
+import time
+import urllib.request
+from urllib.parse import urlparse
+from catalog import parse_tle_lines
+
+# Local copies of TLE urls. A copy is fetched once and reused while it is
+# fresh, the file mtime is the time it was fetched. New copies are validated
+# and moved in place, so readers never see a partial file.
+MAX_AGE_HOURS = 24.0
+MAX_EPOCH_AGE_DAYS = 7.0
+# Celestrak updates element sets every two hours, fetching more often does
+# not give newer epochs.
+MIN_REFETCH_SECONDS = 2 * 3600
+FETCH_TIMEOUT = 30.0
+
+
+def is_url(source):
+    return '://' in source
+
+
+def tle_epoch(first_line):
+    # Epoch field is two digit year and fractional day of year, years below 57 are 20xx.
+    year = int(first_line[18:20])
+    year += 2000 if year < 57 else 1900
+    day = float(first_line[20:32])
+    start = datetime.datetime(year, 1, 1, tzinfo=datetime.timezone.utc)
+    return start.timestamp() + (day - 1.0) * 86400.0
+
+
+def median_epoch(path):
+    with open(path) as tle_file:
+        _, first_lines, _ = parse_tle_lines(tle_file)
+    if not first_lines:
+        return None
+    epochs = sorted(tle_epoch(line) for line in first_lines)
+    return epochs[len(epochs) // 2]
+
+
+class TleStore:
+
+    def __init__(self, folder, max_age_hours=MAX_AGE_HOURS,
+                 max_epoch_age_days=MAX_EPOCH_AGE_DAYS, offline=False):
+        self.folder = folder
+        self.max_age = max_age_hours * 3600.0
+        self.max_epoch_age = max_epoch_age_days * 86400.0
+        self.offline = offline
+
+    def entry_path(self, url):
+        parsed = urlparse(url)
+        name = os.path.basename(parsed.path) or 'catalog.txt'
+        if parsed.query:
+            # Celestrak gp.php urls differ only in query.
+            digest = hashlib.sha1(parsed.query.encode()).hexdigest()[:8]
+            name = f'{os.path.splitext(name)[0]}_{digest}.txt'
+        return os.path.join(self.folder, name)
+
+    def staleness(self, path, now=None):
+        # Returns None for a fresh entry, otherwise reason it should be refetched.
+        now = time.time() if now is None else now
+        fetch_age = now - os.path.getmtime(path)
+        if fetch_age > self.max_age:
+            return f'fetched {fetch_age/3600:.1f} h ago'
+        epoch = median_epoch(path)
+        if epoch is None:
+            return 'no element sets'
+        if now - epoch > self.max_epoch_age and fetch_age > MIN_REFETCH_SECONDS:
+            return f'median epoch {(now - epoch)/86400:.1f} days old'
+        return None
+
+    def fetch(self, url, path):
+        os.makedirs(self.folder, exist_ok=True)
+        temporary_path = path + '.tmp'
+        try:
+            with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+                with open(temporary_path, 'wb') as tle_file:
+                    shutil.copyfileobj(response, tle_file)
+            if median_epoch(temporary_path) is None:
+                raise ValueError(f'No element sets in {url}')
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def resolve(self, source):
+        # Returns path of a local TLE file for source, local paths are returned as is.
+        if not is_url(source):
+            return source
+        path = self.entry_path(source)
+        exists = os.path.exists(path)
+        reason = self.staleness(path) if exists else 'not in store'
+        if reason is None:
+            return path
+        if self.offline:
+            if not exists:
+                raise FileNotFoundError(f'{source} is not in TLE store {self.folder}, '
+                                        'seed it or run without --offline')
+            print(f'Using stale {path} in offline mode, {reason}')
+            return path
+        print(f'Fetching {source}, {reason}')
+        try:
+            self.fetch(source, path)
+        except Exception as e:
+            if not exists:
+                raise
+            print(f'Fetch failed, using stored {path} -> {e!r}')
+        return path
+
+    def seed(self, paths):
+        # Copies local TLE files into the store, keeping their mtime so old
+        # files are not taken for fresh downloads. Newer entries are kept.
+        seeded = []
+        for path in paths:
+            target = os.path.join(self.folder, os.path.basename(path))
+            if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                continue
+            os.makedirs(self.folder, exist_ok=True)
+            temporary_path = target + '.tmp'
+            shutil.copy2(path, temporary_path)
+            os.replace(temporary_path, target)
+            seeded.append(target)
+        return seeded
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sources', type=str, nargs='*',
+                        help='TLE urls to resolve')
+    parser.add_argument('--store', type=str, default='./local/tle',
+                        help='Folder with stored TLE files')
+    parser.add_argument('--seed', type=str, nargs='*', default=[],
+                        help='Local TLE files copied into the store, may be globs')
+    parser.add_argument('--offline', action='store_true',
+                        help='Only read from the store')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    store = TleStore(args.store, offline=args.offline)
+    paths = [path for pattern in args.seed for path in sorted(glob.glob(pattern))]
+    for path in store.seed(paths):
+        print(f'Seeded {path}')
+    for source in args.sources:
+        path = store.resolve(source)
+        print(f'{source} -> {path} ({store.staleness(path) or "fresh"})')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+import argparse
+import bisect
+import gzip
+import io
+import mmap
+import os
+import struct
+import numpy as np
+
+# Binary trace layout: 16 byte header followed by fixed size records of
+# little endian int64 timestamp and float32/float64 latitude and longitude.
+MAGIC = b'SATTRACE'
+VERSION = 1
+HEADER = struct.Struct('<8sHHI')
+# Header flags, adaptive traces have uneven time between samples.
+ADAPTIVE = 1
+TEXT_EXTENSION = '.txt'
+BINARY_EXTENSION = '.trace'
+# Compressed traces get one more extension, zstd needs the zstandard package.
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+# Bytes read backwards to find the start of a text line.
+TEXT_LOOKBEHIND = 256
+# Bytes copied at once when a trace is appended to another.
+COPY_CHUNK = 1 << 20
+
+
+def record_dtype(precision):
+    if precision not in (32, 64):
+        raise ValueError(f'Unsupported precision {precision}, use 32 or 64')
+    return np.dtype([('timestamp', '<i8'), ('lat', f'<f{precision//8}'),
+                     ('lon', f'<f{precision//8}')])
+
+
+def write_header(trace_file, precision=64, flags=0):
+    record_dtype(precision)
+    trace_file.write(HEADER.pack(MAGIC, VERSION, precision, flags))
+
+
+def read_header_fields(trace_file):
+    # Returns precision and flags.
+    data = trace_file.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError('File too short to be a binary trace')
+    magic, version, precision, flags = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError('Not a binary trace file')
+    if version != VERSION:
+        raise ValueError(f'Unsupported binary trace version {version}')
+    return precision, flags
+
+
+def read_header(trace_file):
+    return read_header_fields(trace_file)[0]
+
+
+def write_records(trace_file, timestamps, latitudes, longitudes, precision=64):
+    records = np.empty(len(timestamps), dtype=record_dtype(precision))
+    records['timestamp'] = timestamps
+    records['lat'] = latitudes
+    records['lon'] = longitudes
+    trace_file.write(records.tobytes())
+
+
+def compression_of(path):
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def open_compressed(path, mode='rb', compression=None):
+    # Binary mode file object, compression defaults to the one of path extension.
+    compression = compression or compression_of(path)
+    if compression == 'gzip':
+        # Level 1 output is only a few percent larger than level 6 and
+        # compresses about five times faster, so it keeps up with formatting.
+        return gzip.open(path, mode, compresslevel=1)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('zstd traces need the zstandard package, pip install zstandard')
+        return zstandard.open(path, mode)
+    if compression is not None:
+        raise ValueError(f'Unsupported compression {compression}')
+    return open(path, mode)
+
+
+def is_trace_file(path):
+    # Trace folders may hold other outputs, e.g. visibility events.
+    compression = compression_of(path)
+    if compression is not None:
+        path = path[:-len(COMPRESSION_EXTENSIONS[compression])]
+    return path.endswith((TEXT_EXTENSION, BINARY_EXTENSION))
+
+
+def is_binary_trace(path):
+    with open_compressed(path) as trace_file:
+        return trace_file.read(len(MAGIC)) == MAGIC
+
+
+def is_adaptive_trace(path):
+    # Only binary traces carry flags, text traces are always evenly sampled.
+    if not is_binary_trace(path):
+        return False
+    with open_compressed(path) as trace_file:
+        return bool(read_header_fields(trace_file)[1] & ADAPTIVE)
+
+
+def open_binary_trace(path):
+    # Returned array is a read only view of the mapped file, nothing is parsed
+    # or copied until fields are accessed. Compressed traces are decompressed
+    # into memory.
+    if compression_of(path) is not None:
+        with open_compressed(path) as trace_file:
+            data = trace_file.read()
+        precision = read_header(io.BytesIO(data))
+        return np.frombuffer(data, dtype=record_dtype(precision), offset=HEADER.size)
+    with open(path, 'rb') as trace_file:
+        precision = read_header(trace_file)
+        size = os.fstat(trace_file.fileno()).st_size
+        dtype = record_dtype(precision)
+        count = (size - HEADER.size) // dtype.itemsize
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        mapped = mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(mapped, dtype=dtype, count=count, offset=HEADER.size)
+
+
+def read_text_trace(path):
+    with open_compressed(path) as trace_file:
+        data = np.loadtxt(trace_file, delimiter=';', ndmin=2)
+    if data.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    return data[:, 0].astype(np.int64), data[:, 1], data[:, 2]
+
+
+def load_trace_arrays(path):
+    # Binary traces give column views of the mapped file, text traces are parsed once.
+    if is_binary_trace(path):
+        records = open_binary_trace(path)
+        return records['timestamp'], records['lat'], records['lon']
+    return read_text_trace(path)
+
+
+def convert_text_trace(text_path, binary_path, precision=64):
+    timestamps, latitudes, longitudes = read_text_trace(text_path)
+    with TraceWriter(binary_path, 'binary', precision) as writer:
+        writer.write(timestamps, latitudes, longitudes)
+    return len(timestamps)
+
+
+def format_text_records(timestamps, latitudes, longitudes):
+    # Same text as formatting every row with an f-string, done on whole
+    # chunks so the file gets one write per chunk.
+    return ''.join([f'{timestamp};{latitude};{longitude}\n' for timestamp, latitude, longitude
+                    in zip(np.asarray(timestamps).tolist(), np.asarray(latitudes).tolist(),
+                           np.asarray(longitudes).tolist())]).encode()
+
+
+class TraceWriter:
+    # Writes chunks of samples to a temporary file next to path, the trace
+    # only appears under path once the writer is closed without an error.
+
+    def __init__(self, path, output_format='text', precision=64, compression=None, adaptive=False):
+        if adaptive and output_format != 'binary':
+            raise ValueError('Adaptive traces need binary format')
+        self.path = path
+        self.output_format = output_format
+        self.precision = precision
+        self.temporary_path = path + '.tmp'
+        self.file = open_compressed(self.temporary_path, 'wb', compression or compression_of(path))
+        self.count = 0
+        if output_format == 'binary':
+            write_header(self.file, precision, ADAPTIVE if adaptive else 0)
+
+    def write(self, timestamps, latitudes, longitudes):
+        if self.output_format == 'binary':
+            write_records(self.file, timestamps, latitudes, longitudes, self.precision)
+        else:
+            self.file.write(format_text_records(timestamps, latitudes, longitudes))
+        self.count += len(timestamps)
+
+    def append_trace(self, path):
+        # Copies samples of an uncompressed trace in the format of this one,
+        # e.g. a part written by another process, without parsing them.
+        with open(path, 'rb') as trace_file:
+            if self.output_format == 'binary':
+                precision = read_header(trace_file)
+                if precision != self.precision:
+                    raise ValueError(f'Cannot append {precision} bit trace {path} to {self.precision} bit one')
+            elif trace_file.read(len(MAGIC)) == MAGIC:
+                raise ValueError(f'Cannot append binary trace {path} to a text one')
+            else:
+                trace_file.seek(0)
+            size = 0
+            lines = 0
+            while True:
+                chunk = trace_file.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                self.file.write(chunk)
+                size += len(chunk)
+                lines += chunk.count(b'\n')
+        if self.output_format == 'binary':
+            self.count += size // record_dtype(self.precision).itemsize
+        else:
+            self.count += lines
+
+    def close(self):
+        self.file.close()
+        os.replace(self.temporary_path, self.path)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.temporary_path):
+            os.remove(self.temporary_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class TextTraceReader:
+
+    def __init__(self, path):
+        if compression_of(path) is not None:
+            # Seeking needs random access, so compressed text is kept in memory.
+            with open_compressed(path) as trace_file:
+                self.file = io.BytesIO(trace_file.read())
+        else:
+            self.file = open(path, 'rb')
+        self.size = self.file.seek(0, io.SEEK_END)
+        self.file.seek(0)
+
+    def read(self):
+        line = self.file.readline()
+        if not line:
+            return None
+        timestamp, lat, lon = line.split(b';')
+        return int(timestamp), float(lat), float(lon)
+
+    def skip(self, rows):
+        for _ in range(rows):
+            if not self.file.readline():
+                break
+
+    def first_line_from(self, offset):
+        # Returns start and timestamp of the first line beginning at or after offset.
+        if offset == 0:
+            self.file.seek(0)
+        else:
+            self.file.seek(offset - 1)
+            self.file.readline()
+        start = self.file.tell()
+        line = self.file.readline()
+        if not line.strip():
+            return start, None
+        return start, int(line.split(b';')[0])
+
+    def seek(self, timestamp):
+        # Binary search over byte offsets, lines are sorted by timestamp.
+        low = 0
+        high = self.size
+        while low < high:
+            middle = (low + high) // 2
+            _, line_timestamp = self.first_line_from(middle)
+            if line_timestamp is None or line_timestamp >= timestamp:
+                high = middle
+            else:
+                low = middle + 1
+        start, _ = self.first_line_from(low)
+        self.file.seek(start)
+
+    def previous_line_start(self, offset):
+        # Start of the line ending just before offset, lines are short so a
+        # small block read backwards is enough.
+        block_start = max(offset - TEXT_LOOKBEHIND, 0)
+        self.file.seek(block_start)
+        block = self.file.read(offset - block_start)
+        return block_start + block.rfind(b'\n', 0, len(block) - 1) + 1
+
+    def time_range(self):
+        # First and last timestamp, None for an empty trace.
+        _, first = self.first_line_from(0)
+        if first is None:
+            return None
+        self.file.seek(self.previous_line_start(self.size))
+        last = int(self.file.readline().split(b';')[0])
+        return first, last
+
+    def read_window(self, start, end):
+        # Samples between start and end plus one on each side, so positions
+        # up to both ends can be interpolated.
+        self.seek(start)
+        offset = self.file.tell()
+        if offset > 0:
+            self.file.seek(self.previous_line_start(offset))
+        lines = []
+        for line in self.file:
+            if not line.strip():
+                break
+            lines.append(line)
+            if int(line.split(b';', 1)[0]) > end:
+                break
+        if not lines:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        data = np.loadtxt(lines, delimiter=';', ndmin=2)
+        return data[:, 0].astype(np.int64), data[:, 1], data[:, 2]
+
+    def close(self):
+        self.file.close()
+
+
+class BinaryTraceReader:
+
+    def __init__(self, path):
+        self.records = open_binary_trace(path)
+        self.index = 0
+
+    def read(self):
+        if self.index >= len(self.records):
+            return None
+        record = self.records[self.index]
+        self.index += 1
+        return int(record['timestamp']), float(record['lat']), float(record['lon'])
+
+    def skip(self, rows):
+        self.index = min(self.index + rows, len(self.records))
+
+    def seek(self, timestamp):
+        # Bisect runs on the strided mmap view, no column copy is made.
+        self.index = bisect.bisect_left(self.records['timestamp'], timestamp)
+
+    def time_range(self):
+        if len(self.records) == 0:
+            return None
+        return int(self.records['timestamp'][0]), int(self.records['timestamp'][-1])
+
+    def read_window(self, start, end):
+        # Copies the samples out, so the mapping is released on close.
+        timestamps = self.records['timestamp']
+        first = max(bisect.bisect_left(timestamps, start) - 1, 0)
+        last = min(bisect.bisect_right(timestamps, end) + 1, len(timestamps))
+        records = self.records[first:last]
+        return (records['timestamp'].astype(np.int64), records['lat'].astype(np.float64),
+                records['lon'].astype(np.float64))
+
+    def close(self):
+        self.records = None
+
+
+def open_trace(path):
+    if is_binary_trace(path):
+        return BinaryTraceReader(path)
+    return TextTraceReader(path)
+
+
+def trace_time_range(path):
+    trace = open_trace(path)
+    try:
+        return trace.time_range()
+    finally:
+        trace.close()
+
+
+def read_trace_window(path, start, end):
+    trace = open_trace(path)
+    try:
+        return trace.read_window(start, end)
+    finally:
+        trace.close()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Converts text traces to binary format.')
+    parser.add_argument('traces', type=str, nargs='+',
+                        help='Text trace files to convert')
+    parser.add_argument('-o', '--output_folder', type=str, default=None,
+                        help='Folder for converted files, defaults to folder of each input')
+    parser.add_argument('-p', '--precision', type=int, default=64, choices=(32, 64),
+                        help='Bits used to store latitude and longitude')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    for text_path in args.traces:
+        output_folder = args.output_folder or os.path.dirname(text_path)
+        name = os.path.basename(text_path)
+        if compression_of(name) is not None:
+            name = os.path.splitext(name)[0]
+        name = os.path.splitext(name)[0]
+        binary_path = os.path.join(output_folder, name + BINARY_EXTENSION)
+        count = convert_text_trace(text_path, binary_path, args.precision)
+        print(f'Converted {count} positions {text_path} -> {binary_path}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+import calendar
+import math
+import os
+import time
+import numpy as np
+from sgp4.api import Satrec
+from catalog import Catalog
+from live_catalog import teme_to_geodetic, unix_to_jd
+from trace_format import compression_of, is_trace_file, read_trace_window, trace_time_range
+
+# Positions of satellites are read one time window at a time from trace
+# segments, e.g. daily generate_positions runs into subfolders of one
+# folder. The folder is walked again only when one of its directories
+# changes, so traces generated while the display runs are picked up, and
+# stretches no segment covers can be propagated from a TLE file instead.
+WINDOW_SECONDS = 3 * 3600
+# Samples further apart are a gap, positions are not interpolated across it.
+MAX_GAP = 900
+FALLBACK_STEP = 10
+
+
+def trace_name(file_name):
+    return file_name.split('.')[0].replace('_',' ')
+
+
+def local_offset(timestamp):
+    # generate_positions labels UTC calendar times with time.mktime, adding
+    # this offset to a label gives the moment that was propagated.
+    return calendar.timegm(time.localtime(timestamp)) - timestamp
+
+
+def merge_samples(parts):
+    # Sorts samples of all parts by time, on equal timestamps the earlier
+    # part wins.
+    parts = [part for part in parts if len(part[0])]
+    if not parts:
+        return np.empty(0), np.empty(0), np.empty(0)
+    timestamps = np.concatenate([part[0] for part in parts]).astype(np.float64)
+    lats = np.concatenate([part[1] for part in parts])
+    lons = np.concatenate([part[2] for part in parts])
+    order = np.argsort(timestamps, kind='stable')
+    timestamps = timestamps[order]
+    keep = np.concatenate(([True], np.diff(timestamps) > 0))
+    return timestamps[keep], lats[order][keep], lons[order][keep]
+
+
+def covered(timestamps, moments, max_gap=MAX_GAP):
+    # True for moments that are a sample or lie between two samples less
+    # than max_gap apart.
+    count = len(timestamps)
+    if count == 0:
+        return np.zeros(len(moments), dtype=bool)
+    after = np.searchsorted(timestamps, moments, side='right')
+    before = np.maximum(after - 1, 0)
+    exact = (after > 0) & (timestamps[before] == moments)
+    span = timestamps[np.minimum(after, count - 1)] - timestamps[before]
+    return exact | ((after > 0) & (after < count) & (span <= max_gap))
+
+
+class TraceSegments:
+    # Trace files found under folder grouped by satellite name, time range
+    # of a file is read again only when its size or mtime changes. Traces
+    # are replaced atomically by TraceWriter, which changes the mtime of
+    # their directory, so a scan never sees a half written one and an
+    # unchanged tree needs only a stat per directory. Compressed traces
+    # would have to be decompressed whole for every window, so they are
+    # rejected.
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.ranges = {}
+        self.segments = {}
+        self.directories = None
+        self.rejected = set()
+
+    def changed(self):
+        if self.directories is None:
+            return True
+        for directory, mtime in self.directories.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def scan(self):
+        if not self.changed():
+            return self.segments
+        ranges = {}
+        directories = {}
+        for root, _, files in os.walk(self.folder):
+            directories[root] = os.stat(root).st_mtime_ns
+            for file_name in files:
+                if not is_trace_file(file_name):
+                    continue
+                path = os.path.join(root, file_name)
+                if compression_of(path) is not None:
+                    if path not in self.rejected:
+                        self.rejected.add(path)
+                        print(f'Skipping compressed trace {path}, streaming needs uncompressed traces')
+                    continue
+                try:
+                    stat = os.stat(path)
+                    stamp = (stat.st_mtime_ns, stat.st_size)
+                    if path in self.ranges and self.ranges[path][0] == stamp:
+                        ranges[path] = self.ranges[path]
+                    else:
+                        ranges[path] = (stamp, trace_name(file_name), trace_time_range(path))
+                except (OSError, ValueError) as e:
+                    print(f'Skipping trace {path} -> {e}')
+        self.ranges = ranges
+        self.directories = directories
+        segments = {}
+        for path, (_, name, time_range) in ranges.items():
+            if time_range is not None:
+                segments.setdefault(name, []).append((time_range[0], time_range[1], path))
+        for name_segments in segments.values():
+            name_segments.sort()
+        self.segments = segments
+        return segments
+
+
+class TraceStream:
+    # Loads windows of samples of every satellite. Loading happens on one
+    # thread at a time, so nothing here is locked.
+
+    def __init__(self, folder, window_seconds=WINDOW_SECONDS, tle_file=None, cache_folder=None,
+                 fallback_step=FALLBACK_STEP, max_gap=MAX_GAP):
+        self.segments = TraceSegments(folder)
+        self.window_seconds = window_seconds
+        self.fallback_step = fallback_step
+        self.max_gap = max_gap
+        self.catalog = None
+        if tle_file is not None:
+            self.catalog = Catalog.load(tle_file, cache_folder)
+        self.models = {}
+        self.names = {}
+        self.loaded = 0
+        self.propagated = 0
+        self.failed = 0
+
+    def bounds(self, index):
+        return index * self.window_seconds, (index + 1) * self.window_seconds
+
+    def model(self, name):
+        # Satrec of a traced satellite from the TLE file, None without one.
+        if self.catalog is None:
+            return None
+        if name not in self.models:
+            index = self.catalog.by_name.get(name)
+            self.models[name] = None
+            if index is not None:
+                self.models[name] = Satrec.twoline2rv(self.catalog.first_lines[index],
+                                                      self.catalog.second_lines[index])
+        return self.models[name]
+
+    def propagate(self, name, timestamps):
+        # Positions at trace timestamps, invalid ones are left out.
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        model = self.model(name)
+        if model is None or len(timestamps) == 0:
+            return np.empty(0), np.empty(0), np.empty(0)
+        jd, fr = unix_to_jd(timestamps + local_offset(timestamps[0]))
+        errors, positions, _ = model.sgp4_array(jd, fr)
+        lats, lons = teme_to_geodetic(positions, jd, fr)
+        valid = errors == 0
+        self.propagated += int(valid.sum())
+        return timestamps[valid], lats[valid], lons[valid]
+
+    def fill_gaps(self, name, samples, start, end):
+        step = self.fallback_step
+        grid = np.arange(math.floor(start / step) * step, math.ceil(end / step) * step + step, step,
+                         dtype=np.float64)
+        missing = grid[~covered(samples[0], grid, self.max_gap)]
+        if len(missing) == 0:
+            return samples
+        return merge_samples([samples, self.propagate(name, missing)])
+
+    def load_satellite(self, name, start, end):
+        parts = []
+        for first, last, path in self.segments.segments.get(name, []):
+            if last < start - self.max_gap or first > end + self.max_gap:
+                continue
+            try:
+                parts.append(read_trace_window(path, start, end))
+            except (OSError, ValueError) as e:
+                self.failed += 1
+                print(f'Could not read {path} -> {e}')
+        samples = merge_samples(parts)
+        if self.model(name) is not None:
+            samples = self.fill_gaps(name, samples, start, end)
+        return samples
+
+    def load(self, index):
+        # Maps names to (timestamps, lats, lons) of window index, satellites
+        # without samples in it are left out. Names stay known after their
+        # segments are removed, so the TLE file can take over.
+        start, end = self.bounds(index)
+        for name in self.segments.scan():
+            self.names.setdefault(name)
+        window = {}
+        for name in self.names:
+            samples = self.load_satellite(name, start, end)
+            if len(samples[0]):
+                window[name] = samples
+        self.loaded += 1
+        return window
+
+    def stats(self):
+        return {'windows': self.loaded, 'propagated': self.propagated, 'failed': self.failed,
+                'segments': len(self.segments.ranges)}
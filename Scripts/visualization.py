@@ -1,82 +1,200 @@
 import argparse
+import bisect
+import hashlib
 import math
+import numpy as np
 import serial
 from datetime import datetime
 import time
 import pygame
 import os
-from moviepy.editor import VideoFileClip
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from trace_format import is_adaptive_trace, is_trace_file, load_trace_arrays, open_trace
+from proximity import EARTH_RADIUS_KM, ProximityIndex
+from passes import PassSchedule, find_passes
+from mock_helmet import MOCK_PORT, MockHelmetSerial
+from live_catalog import LiveCatalog
+from observer import events_to_passes, load_events
+from cli import float_pair, lat_lon
+from trace_stream import MAX_GAP, WINDOW_SECONDS, TraceStream, covered, merge_samples
+from ground_track import GroundTracks, estimate_period
+from projection import (PROJECTIONS, Mercator, ScreenProjection, create_projection,
+                        mercator_projection, warp_image)
 
 MILLISECONDS_PER_SECOND = 1000 
+MAX_SIMULATION_STEPS = 5
+MAX_IDLE_WAIT = 1000
+HELMET_RECONNECT_DELAY = 1.0
+# Live catalog only draws highlighted satellites as markers, so pixel
+# distance alerts would miss the rest of the catalog.
+LIVE_ALERT_RADIUS_KM = 1000.0
 enable_debug = False
 
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+def cached_array(cache_folder, cache_name, compute):
+    # Returns array stored in cache_folder, computes and stores it when missing.
+    if cache_folder is None:
+        return compute()
+    cache_path = os.path.join(cache_folder, cache_name)
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            return cached['array']
+    array = compute()
+    os.makedirs(cache_folder, exist_ok=True)
+    temporary_path = cache_path + '.tmp.npz'
+    np.savez(temporary_path, array=array)
+    os.replace(temporary_path, cache_path)
+    return array
+
 class HeadCanvas:
 
-    def __init__(self, file_path, fps, position, size):
-        self.video = VideoFileClip(file_path)
-        self.frames = self.video.iter_frames()
+    def __init__(self, file_path, fps, position, size, cache_folder=None):
+        self.file_path = file_path
+        self.cache_folder = cache_folder
+        self.frames = []
+        self.frame_index = 0
         self.update_period = MILLISECONDS_PER_SECOND/(fps)
         self.time_since_last_update = self.update_period # Always update at first call 
         self.position = position
         self.size = size
 
+    def decode_frames(self, size):
+        # moviepy is only needed when frames are not cached yet
+        from moviepy.editor import VideoFileClip
+        video = VideoFileClip(self.file_path)
+        frames = []
+        for frame in video.iter_frames():
+            gif_surface = pygame.surfarray.make_surface(frame)
+            gif_surface = pygame.transform.scale(gif_surface, size)
+            frames.append(pygame.surfarray.array3d(gif_surface))
+        video.close()
+        return np.stack(frames)
+
+    def reload_frames(self):
+        # Decodes and scales every frame once, called after size is known and
+        # display is set so surfaces can be converted to its pixel format.
+        size = (int(self.size[0]), int(self.size[1]))
+        name = os.path.splitext(os.path.basename(self.file_path))[0]
+        cache_name = f'{name}_{file_digest(self.file_path)}_{size[0]}x{size[1]}.npz'
+        frames = cached_array(self.cache_folder, cache_name, lambda: self.decode_frames(size))
+        self.frames = [pygame.surfarray.make_surface(frame).convert() for frame in frames]
+        self.frame_index = 0
+        print(f'Loaded {len(self.frames)} gif frames')
+
     def update(self, dt, screen):
         self.time_since_last_update += dt
         if self.time_since_last_update < self.update_period:
-            return
+            return []
         self.time_since_last_update = 0
-        try:
-            frame = next(self.frames)
-            gif_surface = pygame.surfarray.make_surface(frame)
-            gif_surface = pygame.transform.scale(gif_surface, self.size)
-            screen.blit(gif_surface, self.position)
-        except StopIteration:
-            self.frames = self.video.iter_frames()
-            frame = next(self.frames)
-            gif_surface = pygame.surfarray.make_surface(frame)
-            gif_surface = pygame.transform.scale(gif_surface, self.size)
-            screen.blit(gif_surface, self.position)
+        rect = screen.blit(self.frames[self.frame_index], self.position)
+        self.frame_index = (self.frame_index + 1) % len(self.frames)
+        return [rect]
+
+    def time_until_update(self):
+        return max(self.update_period - self.time_since_last_update, 0)
+
+class TextRenderCache:
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, background):
+        # Font object is part of the key, so it is kept alive while cached.
+        key = (text, font, color, background)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = font.render(text, True, color, background)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def hit_rate(self):
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def stats(self):
+        return {'size': len(self.surfaces), 'capacity': self.capacity, 'hits': self.hits,
+                'misses': self.misses, 'hit_rate': self.hit_rate()}
 
 class TextField:
 
     def __init__(self, position, font_size=22, satellites=None, 
-                 font_type='freesansbold.ttf'):
+                 font_type='freesansbold.ttf', text_cache=None):
         self.position = position
         self.font = pygame.font.Font(font_type, font_size)
         self.satellites = satellites
+        self.rendered = {}
+        self.text_cache = text_cache if text_cache is not None else TextRenderCache()
+
+    def draw_text(self, screen, slot, text, center):
+        # Text is drawn again only when it changes, previous text is cleared first.
+        previous = self.rendered.get(slot)
+        if previous is not None and previous[0] == text:
+            return []
+        dirty = []
+        if previous is not None:
+            screen.fill((0,0,0), previous[1])
+            dirty.append(previous[1])
+        surface = self.text_cache.render(self.font, text, (255,255,255), (0,0,0))
+        textRect = surface.get_rect()
+        textRect.center = center
+        screen.blit(surface, textRect)
+        self.rendered[slot] = (text, textRect)
+        dirty.append(textRect)
+        return dirty
+
+    def invalidate(self, rects=None):
+        # Slots overlapped by rects drawn over them are drawn again on the
+        # next update, None invalidates all of them.
+        for slot, (_, rect) in list(self.rendered.items()):
+            if rects is None or rect.collidelist(rects) != -1:
+                del self.rendered[slot]
 
     def update(self, dt, screen):
+        dirty = []
         if self.satellites is not None:
             row_offset = 60
             column_offset = 180
             row = 0
             column = 0
-            for satellite in self.satellites.positions.values():
+            for slot, satellite in enumerate(self.satellites.positions.values()):
                 if row > 5:
                     column += 1
                     row = 0
-                text = self.font.render(f'{satellite.lat:2.2f} {satellite.lon:2.2f}', True, (255,255,255), (0,0,0))
-                textRect = text.get_rect()
                 center = list(self.position) 
                 center[0] += column * column_offset
                 center[1] += row * row_offset
-                textRect.center = center
-                screen.blit(text, textRect)
+                dirty.extend(self.draw_text(screen, slot, f'{satellite.lat:2.2f} {satellite.lon:2.2f}', center))
                 row += 1
+        return dirty
 
-class TextField2:
+class TextField2(TextField):
 
     def __init__(self, position, device_location, font_size=32,
-                 font_type='freesansbold.ttf'):
-        self.position = position
+                 font_type='freesansbold.ttf', text_cache=None):
+        super().__init__(position, font_size=font_size, font_type=font_type,
+                         text_cache=text_cache)
         self.device_location = device_location
-        self.font = pygame.font.Font(font_type, font_size)
 
     def update(self, dt, screen):
-        text = self.font.render(f'{self.device_location[0]:2.2f} {self.device_location[1]:2.2f}', True, (255,255,255), (0,0,0))
-        textRect = text.get_rect()
-        textRect.center = self.position 
-        screen.blit(text, textRect)
+        text = f'{self.device_location[0]:2.2f} {self.device_location[1]:2.2f}'
+        return self.draw_text(screen, 0, text, self.position)
 
 
 
@@ -91,141 +209,520 @@ class Position:
 
 
 class Satellites:
+    batched = False
+    # Samples further apart than max_gap seconds are not interpolated.
+    max_gap = None
 
-    def __init__(self, folder, sampling_rate):
+    def __init__(self, folder, sampling_rate, interpolate=False):
         self.sats = {}
+        self.paths = {}
+        self.tracks = {}
+        self.unwrapped = {}
+        self.stopped = set()
+        adaptive = self.open_traces(folder)
+        # Stepping reads one sample per period, which only keeps time for
+        # evenly sampled traces.
+        if adaptive and not interpolate:
+            print(f'Adaptive traces of {", ".join(adaptive)} are played back interpolated')
+            interpolate = True
+        self.update_period = MILLISECONDS_PER_SECOND/sampling_rate
+        self.time_since_last_update = 0
+        self.positions = {}
+        self.proximity = ProximityIndex()
+        self.interpolate = interpolate
+        self.clock_start = time.time()
+        self.clock_timestamp = self.clock_start
+        if interpolate:
+            self.load_tracks()
+
+    def open_traces(self, folder):
+        # Opens every trace in folder, returns names of adaptive ones.
+        adaptive = []
         for entry in os.scandir(folder):
-            if entry.is_file():
+            if entry.is_file() and is_trace_file(entry.name):
                 sat_name = entry.name.split('.')[0].replace('_',' ')
                 sat_path = os.path.join(folder, entry.name)
                 print(f'Satellite {sat_name} at path {sat_path}')
-                sat_file = open(sat_path, "r")
-                self.sats[sat_name] = sat_file 
-        self.update_period = MILLISECONDS_PER_SECOND/sampling_rate
-        self.time_since_last_update = 0
-        self.positions = {}
+                self.sats[sat_name] = open_trace(sat_path)
+                self.paths[sat_name] = sat_path
+                if is_adaptive_trace(sat_path):
+                    adaptive.append(sat_name)
+        return adaptive
+
+    def load_tracks(self):
+        for sat_name, sat_path in self.paths.items():
+            if sat_name not in self.tracks:
+                self.tracks[sat_name] = load_trace_arrays(sat_path)
+
+    def set_position(self, sat_name, position):
+        self.positions[sat_name] = position
+        self.proximity.update(sat_name, position.lat, position.lon)
 
     def update_positions(self):
-        for sat_name, sat_file in self.sats.items():
-            line = sat_file.readline()
+        # A satellite that stops updating is reported once, its marker stays
+        # at the last position.
+        for sat_name, trace in self.sats.items():
             try:
-                timestamp, lat, lon = line.split(';')
-                timestamp = int(timestamp)
-                lat = float(lat)
-                lon = float(lon)
-                position = Position(timestamp, lat, lon)
-                self.positions[sat_name] = position
-            except Exception:
-                pass # If updating fails just ignore it
+                record = trace.read()
+            except (OSError, ValueError) as e:
+                record = None
+                if sat_name not in self.stopped:
+                    print(f'Could not read position of {sat_name} -> {e}')
+            else:
+                if record is None and sat_name not in self.stopped:
+                    print(f'Trace of {sat_name} ended, --stream keeps long runs going')
+            if record is not None:
+                self.set_position(sat_name, Position(*record))
+            else:
+                self.stopped.add(sat_name)
 
     def set_initial_readout(self, initial_timestamp=None, update_timestamps=True):
         if initial_timestamp is None:
             initial_timestamp = datetime.now()
             initial_timestamp = time.mktime(initial_timestamp.timetuple())
+        if update_timestamps:
+            for trace in self.sats.values():
+                trace.seek(initial_timestamp)
+            print(f'Moved satellites to timestamp {initial_timestamp}.')
+        elif self.tracks:
+            initial_timestamp = min(int(track[0][0]) for track in self.tracks.values() if len(track[0]))
         self.update_positions()
-        if not update_timestamps:
+        self.clock_start = time.time()
+        self.clock_timestamp = initial_timestamp
+        if self.interpolate:
+            self.update_interpolated()
+
+    def resync(self, dropped):
+        # Called when dropped milliseconds of simulation steps were skipped.
+        # Stepped traces skip the rows those steps would have read, so they
+        # keep their pace whatever the trace step and sampling rate are.
+        # Interpolated positions already follow the clock.
+        if self.interpolate:
+            return
+        self.time_since_last_update += dropped
+        rows = int(self.time_since_last_update // self.update_period)
+        if rows == 0:
             return
-        skipped_positions = 0
-        while list(self.positions.values())[0].timestamp < initial_timestamp:
-            self.update_positions()
-            skipped_positions += 1
-        print(f'Skipped {skipped_positions} positions.')
+        self.time_since_last_update -= rows * self.update_period
+        for trace in self.sats.values():
+            trace.skip(rows - 1)
+        self.update_positions()
+
+    def positions_at(self, timestamp):
+        # Finds samples around timestamp for every satellite and interpolates
+        # all of them at once, longitude is interpolated along the shorter arc
+        # so crossing the antimeridian does not sweep across the whole map.
+        # Columns of mapped binary traces are strided views, np.searchsorted
+        # would copy them whole, bisect only reads the samples it compares.
+        count = len(self.tracks)
+        times = np.zeros((2, count))
+        lats = np.zeros((2, count))
+        lons = np.zeros((2, count))
+        valid = np.zeros(count, dtype=bool)
+        for i, (timestamps, sat_lats, sat_lons) in enumerate(self.tracks.values()):
+            index = bisect.bisect_right(timestamps, timestamp)
+            if index == 0 or (index == len(timestamps) and timestamps[-1] != timestamp):
+                continue
+            before = index - 1
+            after = min(index, len(timestamps) - 1)
+            times[:, i] = timestamps[before], timestamps[after]
+            lats[:, i] = sat_lats[before], sat_lats[after]
+            lons[:, i] = sat_lons[before], sat_lons[after]
+            valid[i] = True
+        span = times[1] - times[0]
+        if self.max_gap is not None:
+            valid &= span <= self.max_gap
+        fraction = np.divide(timestamp - times[0], span, out=np.zeros(count), where=span > 0)
+        lat = lats[0] + (lats[1] - lats[0]) * fraction
+        lon_delta = (lons[1] - lons[0] + 180.0) % 360.0 - 180.0
+        lon = (lons[0] + lon_delta * fraction + 180.0) % 360.0 - 180.0
+        return lat, lon, valid
+
+    def current_timestamp(self):
+        if self.interpolate or not self.positions:
+            return self.clock_timestamp + time.time() - self.clock_start
+        return max(position.timestamp for position in self.positions.values())
+
+    def predict_passes(self, device_position, distance):
+        # Computes in advance when each satellite is within distance (km) of the device.
+        self.load_tracks()
+        passes = {}
+        for sat_name, (timestamps, lats, lons) in self.tracks.items():
+            passes[sat_name] = find_passes(timestamps, lats, lons,
+                                           device_position.lat, device_position.lon, distance)
+        schedule = PassSchedule(passes, start=self.current_timestamp())
+        print(f'Predicted {sum(len(p) for p in passes.values())} passes in {len(schedule)} alert periods.')
+        return schedule
+
+    def orbit_period(self, sat_name):
+        timestamps, lats, _ = self.tracks[sat_name]
+        return estimate_period(timestamps, lats)
+
+    def track_samples(self, sat_name):
+        # Timestamps, latitudes and unwrapped longitudes of a satellite.
+        sat_timestamps, lats, lons = self.tracks[sat_name]
+        if sat_name not in self.unwrapped:
+            self.unwrapped[sat_name] = np.degrees(np.unwrap(np.radians(lons)))
+        return np.asarray(sat_timestamps, dtype=np.float64), lats, self.unwrapped[sat_name]
+
+    def track_between(self, sat_name, timestamps):
+        # Same interpolation as positions_at, unwrapped longitude makes
+        # np.interp follow the shorter arc between samples.
+        sat_timestamps, lats, unwrapped = self.track_samples(sat_name)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(sat_timestamps) == 0:
+            empty = np.zeros(len(timestamps))
+            return empty, empty, np.zeros(len(timestamps), dtype=bool)
+        valid = (timestamps >= sat_timestamps[0]) & (timestamps <= sat_timestamps[-1])
+        if self.max_gap is not None:
+            valid &= covered(sat_timestamps, timestamps, self.max_gap)
+        lat = np.interp(timestamps, sat_timestamps, lats)
+        lon = (np.interp(timestamps, sat_timestamps, unwrapped) + 180.0) % 360.0 - 180.0
+        return lat, lon, valid
 
+    def update_interpolated(self):
+        timestamp = self.current_timestamp()
+        lat, lon, valid = self.positions_at(timestamp)
+        for i, sat_name in enumerate(self.tracks):
+            if valid[i]:
+                self.set_position(sat_name, Position(timestamp, float(lat[i]), float(lon[i])))
 
     def update(self, dt):
+        if self.interpolate:
+            self.update_interpolated()
+            return
         self.time_since_last_update += dt
         if self.time_since_last_update < self.update_period:
             return
         self.update_positions()
         self.time_since_last_update = 0
 
+    def time_until_update(self):
+        # Interpolated positions change all the time, stepped ones once per period.
+        if self.interpolate:
+            return 0
+        return max(self.update_period - self.time_since_last_update, 0)
+
     def cleanup(self):
-        for _, file in self.sats.items():
-            file.close()
+        for _, trace in self.sats.items():
+            trace.close()
+
+    def satellites_in_range(self, device_position, distance):
+        # Distance in kilometres, returns names of satellites mapped to their distance.
+        return self.proximity.query(device_position.lat, device_position.lon, distance)
 
     def is_satellite_in_range(self, device_position, distance):
-        for position in self.positions:
-           a = position[0]-device_position[0] 
-           b = position[1]-device_position[1]
-           if math.sqrt(a*a+b*b)<distance:
-               return True
-        return False
+        return self.proximity.any_within(device_position.lat, device_position.lon, distance)
+
+class StreamingSatellites(Satellites):
+    # Position source for runs of any length. Only the previous, current and
+    # next time window of samples is held in memory. The next one is loaded
+    # on a background thread once time passes the middle of the current
+    # one, late enough to see segments generated in the meantime. Windows
+    # are loaded by TraceStream, which also propagates satellites where
+    # segments end when a TLE file is given.
+    max_gap = MAX_GAP
+
+    def __init__(self, folder, window_seconds=WINDOW_SECONDS, tle_file=None, cache_folder=None):
+        self.stream = TraceStream(folder, window_seconds, tle_file, cache_folder)
+        self.windows = {}
+        self.index = None
+        self.prefetch = None
+        self.prefetch_index = None
+        self.stalls = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        super().__init__(folder, 1, interpolate=True)
+
+    def open_traces(self, folder):
+        # Traces are found and read by TraceStream, none is kept open.
+        return []
+
+    def load_window(self, index):
+        # Waits for the loader thread, a running prefetch finishes first.
+        if self.prefetch is not None and self.prefetch_index == index:
+            if not self.prefetch.done():
+                self.stalls += 1
+            window = self.prefetch.result()
+            self.prefetch = None
+            return window
+        # Time jumped, a prefetch of another window is no longer needed.
+        if self.prefetch is not None:
+            self.prefetch.cancel()
+            self.prefetch = None
+        return self.executor.submit(self.stream.load, index).result()
+
+    def advance(self, timestamp):
+        window_seconds = self.stream.window_seconds
+        index = math.floor(timestamp / window_seconds)
+        if index != self.index:
+            if index not in self.windows:
+                self.windows[index] = self.load_window(index)
+            self.windows = {i: window for i, window in self.windows.items() if abs(i - index) <= 1}
+            self.index = index
+            self.tracks = self.windows[index]
+            self.unwrapped = {}
+        if self.prefetch is not None and self.prefetch.done():
+            self.windows[self.prefetch_index] = self.prefetch.result()
+            self.prefetch = None
+            self.unwrapped = {}
+        if (self.prefetch is None and index + 1 not in self.windows
+                and timestamp >= (index + 0.5) * window_seconds):
+            self.prefetch_index = index + 1
+            self.prefetch = self.executor.submit(self.stream.load, index + 1)
+
+    def load_tracks(self):
+        # Windows are loaded by advance, whole traces never are.
+        pass
+
+    def track_samples(self, sat_name):
+        # Samples of all windows in memory, so ground tracks reach past the
+        # current one.
+        if sat_name not in self.unwrapped:
+            timestamps, lats, lons = merge_samples([window[sat_name] for _, window
+                                                    in sorted(self.windows.items())
+                                                    if sat_name in window])
+            self.unwrapped[sat_name] = (timestamps, lats, np.degrees(np.unwrap(np.radians(lons))))
+        return self.unwrapped[sat_name]
+
+    def update_interpolated(self):
+        # Satellites without samples around the current time are hidden
+        # instead of left frozen at their last position.
+        timestamp = self.current_timestamp()
+        self.advance(timestamp)
+        lat, lon, valid = self.positions_at(timestamp)
+        current = set()
+        for i, sat_name in enumerate(self.tracks):
+            if valid[i]:
+                self.set_position(sat_name, Position(timestamp, float(lat[i]), float(lon[i])))
+                current.add(sat_name)
+        for sat_name in set(self.positions) - current:
+            print(f'No samples of {sat_name} at {int(timestamp)}, hiding it')
+            del self.positions[sat_name]
+            self.proximity.remove(sat_name)
+
+    def stats(self):
+        return dict(self.stream.stats(), stalls=self.stalls, windows_in_memory=len(self.windows))
+
+    def cleanup(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        print(f'Trace stream {self.stats()}')
 
 class EarthCanvas:
 
     def __init__(self, image_path, satellites, position,
                  size, device_location, alert_distance=0.0,
-                 helmet=None):
+                 helmet=None, alert_radius_km=None, pass_schedule=None,
+                 projection=None, image_projection=None, cache_folder=None,
+                 ground_tracks=None, track_color=(255,200,0)):
         self.image_path = image_path
         self.backdrop = None
+        self.map_image = None
         self.position = position
         self.size = size
         self.satellites = satellites
         self.device_location = device_location
         self.alert_distance = alert_distance
+        self.alert_radius_km = alert_radius_km
+        self.pass_schedule = pass_schedule
         self.helmet = helmet
+        self.retained = False
+        self.full_redraw = True
+        self.canvas_rect = None
+        self.projection = projection if projection is not None else Mercator()
+        self.image_projection = image_projection if image_projection is not None else Mercator()
+        self.cache_folder = cache_folder
+        self.screen_projection = None
+        self.markers = []
+        self.pending_markers = []
+        self.marker_rects = []
+        self.pending_points = None
+        self.ground_tracks = ground_tracks
+        self.track_color = track_color
+        self.tracks_changed = False
+        self.track_lines = []
 
     def reload_image(self):
         print(self.size)
         #sys.exit()
-        self.backdrop = pygame.transform.scale(pygame.image.load(self.image_path), self.size)
+        image = pygame.image.load(self.image_path)
+        if self.image_projection.key() == self.projection.key():
+            self.map_image = pygame.transform.scale(image, self.size)
+        else:
+            self.map_image = pygame.surfarray.make_surface(self.warp_backdrop(image))
+        self.backdrop = self.map_image
+        self.canvas_rect = self.backdrop.get_rect(topleft=(int(self.position[0]), int(self.position[1])))
+        self.screen_projection = ScreenProjection(self.position, self.size, self.projection)
+        self.tracks_changed = self.ground_tracks is not None
+        self.full_redraw = True
+
+    def warp_backdrop(self, image):
+        # Reprojected backdrop is cached per image, projections and size.
+        size = (int(self.size[0]), int(self.size[1]))
+        name = os.path.splitext(os.path.basename(self.image_path))[0]
+        cache_name = (f'{name}_{file_digest(self.image_path)}_{self.image_projection.key()}'
+                      f'_{self.projection.key()}_{size[0]}x{size[1]}.npz')
+        pixels = pygame.surfarray.array3d(image)
+        return cached_array(self.cache_folder, cache_name,
+                            lambda: warp_image(pixels, self.image_projection, self.projection, size))
 
     def update(self, dt, screen):
+        self.simulate(dt)
+        return self.draw(screen)
+
+    def simulate(self, dt):
         self.satellites.update(dt)
-        screen.blit(self.backdrop, self.position)
-        dev_pos = None
-        alert = False
-        if self.device_location is not None:
-            dev_pos = self.draw_position(self.device_location, screen, (255,0,0))
-            if enable_debug:
-                self.draw_range(self.device_location, screen, (255,0,0), self.alert_distance)
-        for _, position in self.satellites.positions.items():
-            sat_pos = self.draw_position(position, screen, (255,255,255))
-            dist = (dev_pos[0] - sat_pos[0])**2 + (dev_pos[1] - sat_pos[1])**2
-            dist = math.sqrt(dist)
-            if dist < self.alert_distance:
-                alert = True
-                if enable_debug:
-                    self.draw_position(position, screen, (0,255,0))
+        if self.ground_tracks is not None:
+            if self.ground_tracks.update(list(self.satellites.positions),
+                                         self.satellites.current_timestamp()):
+                self.tracks_changed = True
+        alert, self.pending_markers = self.compute_markers()
+        if self.satellites.batched:
+            self.pending_points = self.compute_points()
         if self.helmet is not None:
             if alert:
                 self.helmet.activate_pump()
             else:
                 self.helmet.release_pump()
 
+    def resync(self, dropped):
+        self.satellites.resync(dropped)
+        self.simulate(0)
+
+    def draw(self, screen):
+        if self.tracks_changed:
+            self.draw_tracks()
+        if self.satellites.batched:
+            return self.draw_points(screen, self.pending_points, self.pending_markers)
+        return self.draw_markers(screen, self.pending_markers)
+
+    def compute_track_lines(self):
+        # Polylines in screen pixels, split where the projection hides the track.
+        lines = []
+        for lats, lons in self.ground_tracks.segments():
+            xs, ys, visible = self.screen_projection.project(lats, lons)
+            x = xs - int(self.position[0])
+            y = ys - int(self.position[1])
+            breaks = np.flatnonzero(np.diff(visible.astype(np.int8)) != 0) + 1
+            for part_x, part_y, part_visible in zip(np.split(x, breaks), np.split(y, breaks),
+                                                    np.split(visible, breaks)):
+                if len(part_visible) > 1 and part_visible[0]:
+                    lines.append(list(zip(part_x.tolist(), part_y.tolist())))
+        return lines
+
+    def draw_tracks(self):
+        # Tracks change once per orbit, so they are drawn into a copy of the
+        # map that then serves as backdrop, markers restore it like the map.
+        self.track_lines = self.compute_track_lines()
+        self.backdrop = self.map_image.copy()
+        for points in self.track_lines:
+            pygame.draw.lines(self.backdrop, self.track_color, False, points, 2)
+        self.tracks_changed = False
+        self.full_redraw = True
+
+    def compute_points(self):
+        xs, ys, visible = self.screen_projection.project(self.satellites.lats, self.satellites.lons)
+        visible &= self.satellites.valid
+        return xs[visible], ys[visible]
+
+    def draw_points(self, screen, points, markers):
+        # Whole catalog moves every step, so canvas is redrawn and points are
+        # stamped into screen pixels with array indexing instead of one draw
+        # call per satellite.
+        dirty = [screen.blit(self.backdrop, self.position)]
+        if points is not None:
+            xs, ys = points
+            pixels = pygame.surfarray.pixels2d(screen)
+            color = screen.map_rgb((255,255,255))
+            right = self.canvas_rect.right - 1
+            bottom = self.canvas_rect.bottom - 1
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    pixels[np.clip(xs + dx, self.canvas_rect.x, right),
+                           np.clip(ys + dy, self.canvas_rect.y, bottom)] = color
+            del pixels
+        for center, color, radius, width in markers:
+            pygame.draw.circle(screen, color, center, radius, width=width)
+        return dirty
+
+    def time_until_update(self):
+        return self.satellites.time_until_update()
+
+    def compute_markers(self):
+        # Markers are (center, color, radius, width) tuples, drawing is done
+        # separately so an unchanged frame can be skipped entirely.
+        markers = []
+        dev_pos = None
+        alert = False
+        in_range = {}
+        if self.device_location is not None:
+            dev_pos = self.screen_position(self.device_location)
+            if dev_pos is not None:
+                markers.append((dev_pos, (255,0,0), 5, 0))
+                if enable_debug:
+                    markers.append((dev_pos, (255,0,0), self.range_in_pixels(), 2))
+            if self.pass_schedule is not None:
+                timestamp = self.satellites.current_timestamp()
+                in_range = self.pass_schedule.active_satellites(timestamp)
+                alert = len(in_range) > 0
+            elif self.alert_radius_km is not None:
+                in_range = self.satellites.satellites_in_range(self.device_location, self.alert_radius_km)
+                alert = len(in_range) > 0
+        positions = list(self.satellites.positions.items())
+        xs, ys, visible = self.screen_projection.project([position.lat for _, position in positions],
+                                                         [position.lon for _, position in positions])
+        for (sat_name, position), x, y, shown in zip(positions, xs.tolist(), ys.tolist(), visible.tolist()):
+            if not shown:
+                continue
+            sat_pos = (x, y)
+            markers.append((sat_pos, (255,255,255), 5, 0))
+            if self.alert_radius_km is None and self.pass_schedule is None and dev_pos is not None:
+                dist = (dev_pos[0] - sat_pos[0])**2 + (dev_pos[1] - sat_pos[1])**2
+                dist = math.sqrt(dist)
+                if dist < self.alert_distance:
+                    alert = True
+                    in_range[sat_name] = dist
+            if enable_debug and sat_name in in_range:
+                markers.append((sat_pos, (0,255,0), 5, 0))
+        return alert, markers
+
+    def draw_markers(self, screen, markers):
+        # In retained mode backdrop is restored only under previous markers.
+        if self.retained and not self.full_redraw and markers == self.markers:
+            return []
+        if self.retained and not self.full_redraw:
+            dirty = list(self.marker_rects)
+            for rect in self.marker_rects:
+                area = rect.clip(self.canvas_rect)
+                screen.blit(self.backdrop, area, area.move(-self.canvas_rect.x, -self.canvas_rect.y))
+        else:
+            dirty = [screen.blit(self.backdrop, self.position)]
+            self.full_redraw = False
+        self.marker_rects = [pygame.draw.circle(screen, color, center, radius, width=width)
+                             for center, color, radius, width in markers]
+        self.markers = markers
+        return dirty + self.marker_rects
+
     def mercator_projection(self, longitude, latitude):
-        # Define the Mercator projection bounds
-        max_longitude = 180.0
-        min_longitude = -180.0
-        max_latitude = 85.051129
-        min_latitude = -85.051129
-
-        # Clamp the longitude and latitude within the bounds
-        longitude = max(min(longitude, max_longitude), min_longitude)
-        latitude = max(min(latitude, max_latitude), min_latitude)
-
-        # Convert latitude and longitude to radians
-        lat_rad = math.radians(latitude)
-
-        # Perform the Mercator projection
-        x = (longitude + 180.0) / 360.0
-        y = (1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0
-
-        return x, y
-
-    def draw_position(self, position, screen, color):
-        x,y = self.mercator_projection(position.lon, position.lat)
-        x = int((x)*self.size[0]+self.position[0])
-        y = int((y)*self.size[1]+self.position[1])
-        pygame.draw.circle(screen, color, (x, y), 5)
-        return x, y
-
-    def draw_range(self, position, screen, color, radius):
-        x,y = self.mercator_projection(position.lon, position.lat)
-        x = int((x)*self.size[0]+self.position[0])
-        y = int((y)*self.size[1]+self.position[1])
-        pygame.draw.circle(screen, color, (x, y), radius, width=2)
-        return x, y
+        return mercator_projection(longitude, latitude)
+
+    def screen_position(self, position):
+        x, y, visible = self.screen_projection.project([position.lat], [position.lon])
+        if not visible[0]:
+            return None
+        return int(x[0]), int(y[0])
+
+    def range_in_pixels(self):
+        if self.alert_radius_km is None:
+            return self.alert_distance
+        # Distance on screen to a point radius away along the meridian.
+        radius_deg = math.degrees(self.alert_radius_km / EARTH_RADIUS_KM)
+        lat = self.device_location.lat
+        edge_lat = lat + radius_deg if lat + radius_deg <= 90.0 else lat - radius_deg
+        center = self.screen_position(self.device_location)
+        edge = self.screen_position(Position(0, edge_lat, self.device_location.lon))
+        if center is None or edge is None:
+            return 1
+        return max(int(math.hypot(edge[0] - center[0], edge[1] - center[1])), 1)
 
     def cleanup(self):
         self.satellites.cleanup()
@@ -237,50 +734,172 @@ class Helmet:
     ROZKAZ_SERWO_WLACZ = b'S'
     ROZKAZ_SERWO_WYLACZ = b'Z'
     ROZKAZ_DEMO = b'D'
+    PUMP = 'pump'
+    SERVO = 'servo'
 
-    def __init__(self, serial_path):
+    def __init__(self, serial_path, write_timeout=0.1, queue_size=16, late_threshold=0.1):
+        # Commands are written by a background thread so the render loop never
+        # waits for the serial port. Only state changes are sent and a newer
+        # pump or servo command replaces one that was not written yet.
+        self.state = {Helmet.PUMP: None, Helmet.SERVO: None}
+        self.pending = {}
+        self.queue_size = queue_size
+        self.late_threshold = late_threshold
+        self.sent = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.late = 0
+        self.reconnects = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.writer = None
+        self.serial_path = serial_path
+        self.write_timeout = write_timeout
         if serial_path is None:
             self.serial = None
         else:
-            self.serial = serial.Serial(serial_path)
+            self.serial = self.open_port()
+            self.running = True
+            self.writer = threading.Thread(target=self.write_loop, daemon=True)
+            self.writer.start()
+
+    def send(self, command, group=None):
+        with self.lock:
+            if group is not None:
+                if self.state[group] == command:
+                    self.skipped += 1
+                    return
+                self.state[group] = command
+            if self.serial is None:
+                return
+            # Commands without a group (demo) are queued under their own keys.
+            key = group if group is not None else len(self.pending)
+            if key in self.pending:
+                self.coalesced += 1
+            elif len(self.pending) >= self.queue_size:
+                self.dropped += 1
+                return
+            self.pending[key] = (command, group, time.monotonic())
+        self.wakeup.set()
+
+    def open_port(self):
+        if self.serial_path == MOCK_PORT:
+            return MockHelmetSerial(write_timeout=self.write_timeout)
+        return serial.Serial(self.serial_path, write_timeout=self.write_timeout)
+
+    def forget_state(self, group=None, command=None):
+        # State is unknown after a lost command, so it is sent again next
+        # time. Without a group every cached state is forgotten. Caller holds
+        # the lock.
+        for key in self.state:
+            if group is None or (key == group and self.state[key] == command):
+                self.state[key] = None
+
+    def reconnect(self, error):
+        # Runs on the writer thread until the port opens again or cleanup
+        # stops it, commands keep queueing meanwhile.
+        print(f'Helmet connection lost -> {error}, reconnecting')
+        try:
+            self.serial.close()
+        except serial.SerialException:
+            pass
+        while self.running:
+            time.sleep(HELMET_RECONNECT_DELAY)
+            try:
+                self.serial = self.open_port()
+            except serial.SerialException:
+                continue
+            with self.lock:
+                self.reconnects += 1
+                # The helmet may have restarted while disconnected.
+                self.forget_state()
+            print('Helmet reconnected')
+            return True
+        return False
+
+    def write_loop(self):
+        while self.running or self.pending:
+            self.wakeup.wait()
+            with self.lock:
+                self.wakeup.clear()
+                batch = sorted(self.pending.values(), key=lambda item: item[2])
+                self.pending = {}
+            for command, group, queued_at in batch:
+                try:
+                    self.serial.write(command)
+                except serial.SerialTimeoutException:
+                    with self.lock:
+                        self.dropped += 1
+                        if group is not None:
+                            self.forget_state(group, command)
+                    continue
+                except serial.SerialException as e:
+                    with self.lock:
+                        self.dropped += 1
+                        if group is not None:
+                            self.forget_state(group, command)
+                    if not self.reconnect(e):
+                        return
+                    continue
+                with self.lock:
+                    self.sent += 1
+                    if time.monotonic() - queued_at > self.late_threshold:
+                        self.late += 1
 
-    
     def activate_pump(self):
-        if self.serial is None:
-            return
-        self.serial.write(Helmet.ROZKAZ_POMPA_WLACZ)
+        self.send(Helmet.ROZKAZ_POMPA_WLACZ, Helmet.PUMP)
 
     def stop_pump(self):
-        if self.serial is None:
-            return
-        self.serial.write(Helmet.ROZKAZ_POMPA_WYLACZ)
+        self.send(Helmet.ROZKAZ_POMPA_WYLACZ, Helmet.PUMP)
 
     def release_pump(self):
-        if self.serial is None:
-            return
-        self.serial.write(Helmet.ROZKAZ_ODPOWIETRZANIE_WLACZ)
+        self.send(Helmet.ROZKAZ_ODPOWIETRZANIE_WLACZ, Helmet.PUMP)
 
     def activate_servo(self):
-        if self.serial is None:
-            return
-        self.serial.write(Helmet.ROZKAZ_SERWO_WLACZ)
+        self.send(Helmet.ROZKAZ_SERWO_WLACZ, Helmet.SERVO)
 
     def deactivate_servo(self):
-        if self.serial is None:
-            return
-        self.serial.write(Helmet.ROZKAZ_SERWO_WYLACZ)
+        self.send(Helmet.ROZKAZ_SERWO_WYLACZ, Helmet.SERVO)
 
     def play_demo(self):
-        if self.serial is None:
-            return
-        self.serial.write(Helmet.ROZKAZ_DEMO)
-    
+        # The demo loop in the firmware ends with the pump released and the
+        # servo at rest, so cached state no longer matches the helmet.
+        self.send(Helmet.ROZKAZ_DEMO)
+        with self.lock:
+            self.forget_state()
+
+    def stats(self):
+        return {'sent': self.sent, 'skipped': self.skipped, 'coalesced': self.coalesced,
+                'dropped': self.dropped, 'late': self.late, 'reconnects': self.reconnects}
+
+    def cleanup(self, timeout=1.0):
+        if self.writer is not None:
+            self.running = False
+            self.wakeup.set()
+            self.writer.join(timeout)
+            self.writer = None
+        if self.serial is not None:
+            self.serial.close()
+        print(f'Helmet commands {self.stats()}')
+        if isinstance(self.serial, MockHelmetSerial):
+            print(f'Mock helmet {self.serial.stats()}')
 
 
 class ManWhoLaughsDisplay:
 
-    def __init__(self, head, earth, helmet, text_field, text_field2):
+    def __init__(self, head, earth, helmet, text_field, text_field2, full_flip=False,
+                 max_fps=0, simulation_rate=0, idle=False):
         self.helmet = helmet
+        self.full_flip = full_flip
+        self.first_frame = True
+        self.max_fps = max_fps
+        # Simulation runs in fixed steps independent of rendering, 0 steps
+        # it once per rendered frame with the real frame time.
+        self.simulation_period = MILLISECONDS_PER_SECOND/simulation_rate if simulation_rate > 0 else 0
+        self.simulation_time = 0
+        self.idle = idle
         self.screen = pygame.display.set_mode((0,0), pygame.FULLSCREEN)
         screen_size = self.screen.get_size()
         self.head = head
@@ -288,12 +907,14 @@ class ManWhoLaughsDisplay:
         head_position = (screen_size[0]*self.head.position[0], screen_size[1]*self.head.position[1])
         self.head.size = head_size
         self.head.position = head_position
+        self.head.reload_frames()
         self.earth = earth
         earth_size = (screen_size[0]*self.earth.size[0], screen_size[1]*self.earth.size[1])
         earth_position = (screen_size[0]*self.earth.position[0], screen_size[1]*self.earth.position[1])
         print(f'Earth position = {earth_position} Earth size = {earth_size}')
         self.earth.position = earth_position
         self.earth.size = earth_size
+        self.earth.retained = not full_flip
         self.earth.reload_image()
         self.text_field = text_field
         text_position = (screen_size[0]*self.text_field.position[0], screen_size[1]*self.text_field.position[1])
@@ -305,13 +926,65 @@ class ManWhoLaughsDisplay:
 
     def update(self):
         self.handle_events()
-        dt = self.clock.tick()
+        dt = self.clock.tick(self.max_fps)
+        if self.first_frame:
+            self.earth.simulate(0)
+        self.simulate(dt)
         #self.screen.fill((0,0,0))
-        self.head.update(dt, self.screen)
-        self.earth.update(dt, self.screen)
-        self.text_field.update(dt, self.screen)
-        self.text_field2.update(dt, self.screen)
-        pygame.display.flip()
+        dirty = self.head.update(dt, self.screen)
+        dirty += self.earth.draw(self.screen)
+        # Text is drawn last, slots painted over by the gif or the map are
+        # drawn again. A full flip redraws all of it like before dirty rects.
+        covered_rects = None if self.full_flip else dirty
+        self.text_field.invalidate(covered_rects)
+        self.text_field2.invalidate(covered_rects)
+        dirty += self.text_field.update(dt, self.screen)
+        dirty += self.text_field2.update(dt, self.screen)
+        if self.full_flip or self.first_frame:
+            pygame.display.flip()
+            self.first_frame = False
+        elif dirty:
+            pygame.display.update(dirty)
+        if self.idle:
+            self.wait_for_change()
+
+    def simulate(self, dt):
+        if self.simulation_period == 0:
+            self.earth.simulate(dt)
+            return
+        self.simulation_time += dt
+        steps = 0
+        while self.simulation_time >= self.simulation_period:
+            self.simulation_time -= self.simulation_period
+            steps += 1
+            if steps > MAX_SIMULATION_STEPS:
+                # Fell too far behind, skip the backlog instead of catching
+                # up and move satellites to where they are now.
+                dropped = self.simulation_period + self.simulation_time
+                self.simulation_time = 0
+                self.earth.resync(dropped)
+                break
+            self.earth.simulate(self.simulation_period)
+
+    def time_until_change(self):
+        # Satellites only see time passing in simulation steps.
+        waits = [self.head.time_until_update()]
+        if self.earth.satellites.interpolate and self.simulation_period > 0:
+            waits.append(self.simulation_period - self.simulation_time)
+        else:
+            waits.append(max(self.earth.time_until_update() - self.simulation_time, 0))
+        return min(waits)
+
+    def wait_for_change(self):
+        # Sleeps until gif frame or satellite positions are due, frame cap
+        # already waited for its part. Events cut the wait short.
+        frame_time = MILLISECONDS_PER_SECOND/self.max_fps if self.max_fps > 0 else 0
+        wait = int(self.time_until_change() - frame_time)
+        if wait <= 0:
+            return
+        event = pygame.event.wait(min(wait, MAX_IDLE_WAIT))
+        if event.type != pygame.NOEVENT:
+            pygame.event.post(event)
 
     def handle_events(self):
         for event in pygame.event.get():
@@ -331,17 +1004,14 @@ class ManWhoLaughsDisplay:
 
     def cleanup(self):
         self.earth.cleanup()
+        self.helmet.cleanup()
+        print(f'Text cache {self.text_field.text_cache.stats()}')
 
 
 def integer_pair(txt):
     val1, val2 = txt.split('x')
     return (int(val1), int(val2))
 
-def float_pair(txt):
-    txt = txt.replace('n','-')
-    val1, val2 = txt.split('x')
-    return (float(val1), float(val2))
-
 def parse_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument('-g', '--gif_file', type=str, required=True,
@@ -350,25 +1020,51 @@ def parse_arguments():
                         help='Frames per second of gif animation')
     parser.add_argument('--gif_size', type=float_pair, default=(0.3,0.3),
                         help='Size of animated gif')
+    parser.add_argument('--gif_cache', type=str, default=None,
+                        help='Folder for decoded gif frames, skips decoding on next runs.')
     parser.add_argument('--gif_position', type=float_pair, default=(0,0),
                         help='Position of top left corner of gif.')
-    parser.add_argument('-s', '--satellite_directory', type=str, required=True,
+    parser.add_argument('-s', '--satellite_directory', type=str, default=None,
                         help='Folder with satellite files')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read satellite_directory and its subfolders in time windows, new trace '
+                             'segments are picked up while running.')
+    parser.add_argument('--stream_window', type=int, default=WINDOW_SECONDS,
+                        help='Seconds of samples in one streamed window.')
+    parser.add_argument('--fallback_tle', type=str, default=None,
+                        help='TLE file used to propagate streamed satellites where no segment has samples.')
+    parser.add_argument('--tle_catalog', type=str, default=None,
+                        help='TLE file propagated live instead of reading satellite files')
+    parser.add_argument('--highlight', type=str, default='',
+                        help='Catalog satellites shown as markers and text, separated by comma. '
+                             'Each entry is a name, NORAD ID, international designator or name glob.')
+    parser.add_argument('--catalog_cache', type=str, default=None,
+                        help='Folder for parsed TLE catalogs, skips parsing on next runs.')
     parser.add_argument('-e', '--earth_file', type=str, required=True,
                         help='Path to earth backdrop image')
     parser.add_argument('--initial_timestamp', type=int, default=None,
                         help='Initial timestampt in unix format, set only during tests.')
     parser.add_argument('--sampling_rate', type=int, default=1,
                         help='Sampling rate of satellite positions in seconds')
+    parser.add_argument('--interpolate', action='store_true',
+                        help='Interpolate positions from wall clock instead of stepping through samples.')
     parser.add_argument('--disable_timestamp_adjustment', action='store_true',
                         help='Disables adjustment of timestamps in satellite file (FOR TESTS ONLY).')
     parser.add_argument('--display_position', type=float_pair, default=(0.7,1.0),
                         help='Position of earth and satellites display')
     parser.add_argument('--display_size', type=float_pair, default=(0.3,0),
                         help='Size of display that shows earth and satellites')
+    parser.add_argument('--projection', type=str, default='mercator', choices=sorted(PROJECTIONS),
+                        help='Map projection used for display')
+    parser.add_argument('--earth_projection', type=str, default='mercator', choices=sorted(PROJECTIONS),
+                        help='Projection of earth backdrop image, it is reprojected when different')
+    parser.add_argument('--projection_center', type=float_pair, default=None,
+                        help='Lat lon at center of orthographic projection, defaults to device location')
+    parser.add_argument('--projection_cache', type=str, default=None,
+                        help='Folder for reprojected backdrops')
     parser.add_argument('--helmet_port', type=str, default=None,
-                        help='Serial port for communication with helmet.')
-    parser.add_argument('--device_location', type=float_pair, default=None,
+                        help=f'Serial port for communication with helmet, "{MOCK_PORT}" simulates the device.')
+    parser.add_argument('--device_location', type=lat_lon, default=None,
                         help='Lat lon')
     parser.add_argument('--text_location', type=float_pair, default=(0.5, 0.5),
                         help='Loacation at which text will be displayed')
@@ -380,11 +1076,50 @@ def parse_arguments():
                         help='Size of font for satellite locations')
     parser.add_argument('--font_type', type=str, default='freesansbold.ttf',
                         help='Type of font used in application')
+    parser.add_argument('--text_cache_size', type=int, default=256,
+                        help='Number of rendered texts kept in memory')
     parser.add_argument('--alert_distance', type=float, default=10.0,
                         help='Distance')
+    parser.add_argument('--alert_radius_km', type=float, default=None,
+                        help='Great circle alert radius in km, replaces pixel based alert_distance')
+    parser.add_argument('--predict_passes', action='store_true',
+                        help='Compute alert periods at startup instead of checking distance every frame, needs alert_radius_km')
+    parser.add_argument('--events_file', type=str, default=None,
+                        help='Visibility events from generate_positions, alerts while a satellite is '
+                             'above minimum elevation. Observer in file is used without device_location.')
+    parser.add_argument('--ground_tracks', action='store_true',
+                        help='Draw past and future ground track of every shown satellite.')
+    parser.add_argument('--track_periods', type=float_pair, default=(1.0, 1.0),
+                        help='Orbits of ground track drawn before and after the current one, e.g. 1x2.')
+    parser.add_argument('--max_fps', type=int, default=60,
+                        help='Frame rate cap, 0 renders as fast as possible.')
+    parser.add_argument('--simulation_rate', type=int, default=10,
+                        help='Satellite and helmet updates per second, 0 updates every frame.')
+    parser.add_argument('--disable_idle', action='store_true',
+                        help='Keep rendering at max_fps even when nothing changes.')
+    parser.add_argument('--full_flip', action='store_true',
+                        help='Redraw and present whole screen every frame instead of changed areas.')
     parser.add_argument('--enable_debug', action='store_true',
                         help='Enables debug information')
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.satellite_directory is None and args.tle_catalog is None:
+        parser.error('either --satellite_directory or --tle_catalog is required')
+    streamed = args.stream and args.tle_catalog is None
+    if args.stream and args.satellite_directory is None:
+        parser.error('--stream needs --satellite_directory')
+    if args.fallback_tle is not None and not streamed:
+        parser.error('--fallback_tle is only used with --stream')
+    if args.predict_passes and args.events_file is None:
+        if streamed or args.tle_catalog is not None:
+            parser.error('passes can not be predicted from streamed traces or a live catalog, '
+                         'use --events_file instead')
+        if args.device_location is None or args.alert_radius_km is None:
+            parser.error('--predict_passes needs --device_location and --alert_radius_km')
+    if (args.tle_catalog is not None and args.device_location is not None
+            and args.alert_radius_km is None and args.events_file is None):
+        print(f'Live catalog alerts within default alert_radius_km {LIVE_ALERT_RADIUS_KM:.0f}')
+        args.alert_radius_km = LIVE_ALERT_RADIUS_KM
+    return args
 
 
 def main():
@@ -395,18 +1130,56 @@ def main():
     device_location = None
     if args.device_location is not None:
         device_location = Position(0, args.device_location[0], args.device_location[1])
+    events = None
+    if args.events_file is not None:
+        names, events, observer, min_elevation = load_events(args.events_file)
+        print(f'Loaded {len(events)} events above {min_elevation} deg seen from {observer[0]:.2f} {observer[1]:.2f}')
+        if device_location is None:
+            device_location = Position(0, observer[0], observer[1])
     helmet = Helmet(args.helmet_port)
-    satellites = Satellites(args.satellite_directory, args.sampling_rate)
+    if args.tle_catalog is not None:
+        highlight = [name for name in args.highlight.replace('_',' ').split(',') if name]
+        satellites = LiveCatalog(args.tle_catalog, Position, highlight, args.catalog_cache)
+    elif args.stream:
+        satellites = StreamingSatellites(args.satellite_directory, args.stream_window,
+                                         args.fallback_tle, args.catalog_cache)
+    else:
+        satellites = Satellites(args.satellite_directory, args.sampling_rate, args.interpolate)
     satellites.set_initial_readout(args.initial_timestamp, not args.disable_timestamp_adjustment)
+    pass_schedule = None
+    if events is not None:
+        pass_schedule = PassSchedule(events_to_passes(names, events), start=satellites.current_timestamp())
+    elif args.predict_passes:
+        pass_schedule = satellites.predict_passes(device_location, args.alert_radius_km)
+    ground_tracks = None
+    if args.ground_tracks:
+        if not satellites.batched:
+            satellites.load_tracks()
+        ground_tracks = GroundTracks(satellites, args.track_periods[0], args.track_periods[1])
+    location = None if device_location is None else (device_location.lat, device_location.lon)
+    projection_center = args.projection_center or location
     earth = EarthCanvas(args.earth_file, satellites, args.display_position,
                         args.display_size, device_location, helmet=helmet,
-                        alert_distance=args.alert_distance)
-    head = HeadCanvas(args.gif_file, args.gif_fps, args.gif_position, args.gif_size)
-    text_field2 = TextField2(args.text2_location, args.device_location,
-                             font_size=args.dev_font_size, font_type=args.font_type)
+                        alert_distance=args.alert_distance,
+                        alert_radius_km=args.alert_radius_km,
+                        pass_schedule=pass_schedule,
+                        projection=create_projection(args.projection, projection_center),
+                        image_projection=create_projection(args.earth_projection, projection_center),
+                        cache_folder=args.projection_cache,
+                        ground_tracks=ground_tracks)
+    head = HeadCanvas(args.gif_file, args.gif_fps, args.gif_position, args.gif_size,
+                      cache_folder=args.gif_cache)
+    text_cache = TextRenderCache(args.text_cache_size)
+    text_field2 = TextField2(args.text2_location, location,
+                             font_size=args.dev_font_size, font_type=args.font_type,
+                             text_cache=text_cache)
     text_field = TextField(args.text_location, satellites=satellites,
-                           font_size=args.sat_font_size, font_type=args.font_type)
-    mwl_display = ManWhoLaughsDisplay(head, earth, helmet, text_field, text_field2)
+                           font_size=args.sat_font_size, font_type=args.font_type,
+                           text_cache=text_cache)
+    mwl_display = ManWhoLaughsDisplay(head, earth, helmet, text_field, text_field2,
+                                      full_flip=args.full_flip, max_fps=args.max_fps,
+                                      simulation_rate=args.simulation_rate,
+                                      idle=not args.disable_idle)
     try:
         while True:
             mwl_display.update()